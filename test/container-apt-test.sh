@@ -2,7 +2,22 @@
 
 set -e
 
-cd /io
-apt-get update
-apt-get install -y $PACKAGE_LIST
+cd ${TEST_DIR:-/io}
+if [ -n "$OS_CACHE" ]; then
+    # the index and the packages were fetched for this image by container-os-cache.sh into
+    # $OS_CACHE, mounted read-only; packages are installed through an archive directory of
+    # this test, linking to the prefetched ones, so apt keeps its locks and downloads
+    # anything missing without touching what other tests read
+    ARCHIVES=/var/cache/os-cache/apt/archives
+    mkdir -p $ARCHIVES/partial
+    for deb in $OS_CACHE/apt/archives/*.deb; do
+        if [ -e "$deb" ]; then
+            ln -s $deb $ARCHIVES/
+        fi
+    done
+    APT_ARGS="-o Dir::State::Lists=$OS_CACHE/apt/lists -o Dir::Cache::Archives=$ARCHIVES"
+else
+    apt-get update
+fi
+apt-get install -y $APT_ARGS $PACKAGE_LIST
 python3 test-script.py
@@ -0,0 +1,21 @@
+#!/bin/bash
+
+# Run every package test prepared in /io/<n>/ one after another in this container.
+# Each test runs the regular per-package script in an environment (and pip cache) of its own and
+# leaves its exit code, start/end time and output in its directory.
+
+cd /io
+for test_dir in $(ls -d /io/*/ | sort -V); do
+    test_dir=${test_dir%/}
+    n=$(basename $test_dir)
+    export TEST_DIR=$test_dir
+    export TEST_VENV=/venvs/$n
+    export CONDA_ENV=env-$n
+    # a pip cache shared by the tests would change what a later test downloads or builds
+    export PIP_CACHE_DIR=$test_dir/.pip-cache
+    export PACKAGE_LIST="$(cat $test_dir/package-list)"
+    start=$(date +%s.%N)
+    timeout --kill-after=10 $(cat $test_dir/timeout) bash /io/$BATCH_TEST_SCRIPT &> $test_dir/output.log
+    echo $? > $test_dir/exit-code
+    echo "$start $(date +%s.%N)" > $test_dir/runtime
+done
@@ -2,10 +2,10 @@
 
 set -e
 
-cd /io
+cd ${TEST_DIR:-/io}
 source $HOME/anaconda/etc/profile.d/conda.sh
-conda create -n my-env
-conda activate my-env
+conda create -n ${CONDA_ENV:-my-env}
+conda activate ${CONDA_ENV:-my-env}
 conda install $PACKAGE_LIST
 
 python3 test-script.py
@@ -0,0 +1,25 @@
+#!/bin/bash
+
+# Refresh the package index of this image once per run into the shared $OS_CACHE, and
+# download everything the APT/YUM tests of this image are going to install, so the tests
+# themselves neither refresh metadata nor fetch packages again. Package lists that fail
+# to download are left for their test to report.
+
+cd /io
+if [ "$1" == "APT" ]; then
+    APT_ARGS="-o Dir::State::Lists=$OS_CACHE/apt/lists -o Dir::Cache::Archives=$OS_CACHE/apt/archives"
+    mkdir -p $OS_CACHE/apt/lists/partial $OS_CACHE/apt/archives/partial
+    apt-get update $APT_ARGS || exit 1
+    # drop packages from earlier runs that are no longer in the index
+    apt-get autoclean $APT_ARGS
+    while read -r package_list; do
+        apt-get install -y --download-only $APT_ARGS $package_list < /dev/null
+    done < package-lists
+elif [ "$1" == "YUM" ]; then
+    YUM_ARGS="--setopt=cachedir=$OS_CACHE/yum --setopt=keepcache=1"
+    yum makecache $YUM_ARGS || exit 1
+    while read -r package_list; do
+        yum install -y --downloadonly $YUM_ARGS $package_list < /dev/null
+    done < package-lists
+fi
+exit 0
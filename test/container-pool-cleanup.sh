@@ -0,0 +1,11 @@
+#!/bin/bash
+
+# Remove what a test run in a pooled container left behind (its directory, venv and conda
+# environment), so the next test dispatched to the container starts from the same state.
+
+rm -rf $TEST_DIR $TEST_VENV
+if [ -f $HOME/anaconda/etc/profile.d/conda.sh ]; then
+    source $HOME/anaconda/etc/profile.d/conda.sh
+    conda env remove -y -n $CONDA_ENV &> /dev/null
+fi
+exit 0
@@ -2,12 +2,38 @@
 
 set -e
 
-source .test/bin/activate
-cd /io
-pip3 install --progress-bar off --upgrade pip
+# the image ships a base venv with an up to date pip; batched and pooled runs ask for a
+# fresh venv of their own in TEST_VENV, cloned from it
+BASE_VENV=/venv-base
+if [ -n "$TEST_VENV" ]; then
+    mkdir -p $TEST_VENV
+    # pip never writes into an installed file, it removes or replaces it, so the site-packages
+    # tree can be shared as hard links; the few small files around it are copied
+    cp -al $BASE_VENV/lib $TEST_VENV/lib
+    find $BASE_VENV -mindepth 1 -maxdepth 1 ! -name lib -exec cp -a {} $TEST_VENV \;
+    # a venv is not relocatable: its scripts and activate name the directory it was created in
+    grep -rlI $BASE_VENV $TEST_VENV/bin | xargs -r sed -i "s|$BASE_VENV|$TEST_VENV|g"
+fi
+source ${TEST_VENV:-$BASE_VENV}/bin/activate
+cd ${TEST_DIR:-/io}
+# pip is only changed when the run pins a version other than the one of the image
+if [ -n "$PINNED_PIP_VERSION" ] && [ "$(python3 -m pip --version | cut -d' ' -f2)" != "$PINNED_PIP_VERSION" ]; then
+    pip3 install --progress-bar off "pip==$PINNED_PIP_VERSION"
+fi
 
 # Check if we will have a mismatch between latest release and wheel, by doing a dry-run
 pip3 install --dry-run --progress-bar off --report pip_latest.json $PIP_EXTRA_ARGS $PACKAGE_LIST &> dryrun_output.log
 
-pip3 install --prefer-binary --progress-bar off --report pip_binary.json $PIP_EXTRA_ARGS $PACKAGE_LIST
+# With a wheel cache mounted, resolve the install first so sdists built on a previous run can be reused
+WHEEL_CACHE_ARGS=""
+if [ -n "$WHEEL_CACHE" ]; then
+    pip3 install --dry-run --prefer-binary --progress-bar off --report pip_plan.json $PIP_EXTRA_ARGS $PACKAGE_LIST &> plan_output.log
+    WHEEL_CACHE_ARGS=$(python3 $(dirname $0)/container-wheel-cache.py lookup pip_plan.json)
+fi
+
+pip3 install --prefer-binary --progress-bar off --report pip_binary.json $PIP_EXTRA_ARGS $WHEEL_CACHE_ARGS $PACKAGE_LIST
+
+if [ -n "$WHEEL_CACHE" ]; then
+    python3 $(dirname $0)/container-wheel-cache.py store pip_binary.json "$(pip3 cache dir)"
+fi
 python3 test-script.py
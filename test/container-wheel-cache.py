@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Runs inside the test containers, with the python of the test venv, so it has to stay
+# compatible with the oldest python3 shipped by the test images.
+#
+# Wheels built from an sdist are kept in $WHEEL_CACHE (one directory per test image) under
+# <SOABI>/<name>-<version>-<sdist sha256>/, so a build is only reused by the same interpreter
+# ABI and only for exactly the same sdist.
+#
+#   container-wheel-cache.py lookup pip_plan.json
+#       print --find-links arguments for every planned sdist that has a cached build
+#   container-wheel-cache.py store pip_binary.json PIP_CACHE_DIR
+#       copy the wheels pip just built for the installed sdists into the cache
+
+import os
+import re
+import sys
+import json
+import glob
+import shutil
+import sysconfig
+import tempfile
+
+
+def canonical_name(name):
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def sdist_entries(report_fname):
+    with open(report_fname) as f:
+        report = json.load(f)
+    for entry in report['install']:
+        download_info = entry.get('download_info', {})
+        archive_info = download_info.get('archive_info')
+        if archive_info is None or download_info['url'].endswith('.whl'):
+            continue
+        sha256 = archive_info.get('hashes', {}).get('sha256')
+        if sha256 is None and archive_info.get('hash', '').startswith('sha256='):
+            sha256 = archive_info['hash'][len('sha256='):]
+        if sha256 is None:
+            continue
+        metadata = entry['metadata']
+        yield metadata['name'], metadata['version'], sha256
+
+
+def cache_entry_dir(name, version, sha256):
+    soabi = sysconfig.get_config_var('SOABI')
+    return os.path.join(os.environ['WHEEL_CACHE'], soabi, f'{canonical_name(name)}-{version}-{sha256}')
+
+
+def lookup(report_fname):
+    find_links = []
+    for name, version, sha256 in sdist_entries(report_fname):
+        entry_dir = cache_entry_dir(name, version, sha256)
+        if len(glob.glob(os.path.join(entry_dir, '*.whl'))) == 0:
+            continue
+        # the modification time of an entry is its last use, for the LRU eviction on the host
+        os.utime(entry_dir)
+        print(f'Wheel cache: using previously built wheel for {name} {version}', file=sys.stderr)
+        find_links.append(f'--find-links {entry_dir}')
+    print(' '.join(find_links))
+
+
+def is_wheel_of(fname, name, version):
+    # wheel file names are {distribution}-{version}(-{build tag})?-{python}-{abi}-{platform}.whl
+    parts = os.path.basename(fname).split('-')
+    return canonical_name(parts[0]) == canonical_name(name) and parts[1] == version
+
+
+def make_shared_dir(path):
+    # the harness prunes the cache as an unprivileged user, so directories created here
+    # by root have to be writable for everyone
+    os.makedirs(path, exist_ok=True)
+    os.chmod(path, 0o777)
+
+
+def store(report_fname, pip_cache_dir):
+    for name, version, sha256 in sdist_entries(report_fname):
+        entry_dir = cache_entry_dir(name, version, sha256)
+        if os.path.isdir(entry_dir):
+            continue
+        built_wheels = [fname for fname in glob.glob(os.path.join(pip_cache_dir, 'wheels', '**', '*.whl'), recursive=True)
+                if is_wheel_of(fname, name, version)]
+        if len(built_wheels) == 0:
+            continue
+        make_shared_dir(os.path.dirname(entry_dir))
+        staging_dir = tempfile.mkdtemp(dir=os.path.dirname(entry_dir))
+        shutil.copy(built_wheels[0], staging_dir)
+        os.chmod(staging_dir, 0o777)
+        try:
+            os.rename(staging_dir, entry_dir)
+            print(f'Wheel cache: stored the wheel built for {name} {version}')
+        except OSError:
+            # another test of the same image stored this build first
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'lookup':
+        lookup(sys.argv[2])
+    elif sys.argv[1] == 'store':
+        store(sys.argv[2], sys.argv[3])
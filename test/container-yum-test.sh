@@ -2,6 +2,18 @@
 
 set -e
 
-cd /io
-yum install -y $PACKAGE_LIST
+cd ${TEST_DIR:-/io}
+if [ -n "$OS_CACHE" ]; then
+    # use the metadata container-os-cache.sh refreshed for this image as it is; $OS_CACHE is
+    # mounted read-only, so the test gets a cache directory of its own with a copy of the
+    # metadata and links to the prefetched packages
+    YUM_CACHE=/var/cache/os-cache/yum
+    mkdir -p $(dirname $YUM_CACHE)
+    cp -rs $OS_CACHE/yum $YUM_CACHE
+    find $YUM_CACHE -type l ! -name '*.rpm' | while read -r fname; do
+        cp --remove-destination "$(readlink "$fname")" "$fname"
+    done
+    YUM_ARGS="--setopt=cachedir=$YUM_CACHE --setopt=keepcache=1 --setopt=metadata_expire=-1"
+fi
+yum install -y $YUM_ARGS $PACKAGE_LIST
 python3 test-script.py
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import queue
+import socket
+import time
+import struct
+import http.client
+from urllib.parse import quote, urlencode
+
+DOCKER_SOCKET = '/var/run/docker.sock'
+API_VERSION = 'v1.41'
+
+
+class DockerAPIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def get_socket_path():
+    # honour DOCKER_HOST the same way the docker CLI does, for unix sockets only
+    docker_host = os.environ.get('DOCKER_HOST', '')
+    if docker_host.startswith('unix://'):
+        return docker_host[len('unix://'):]
+    return DOCKER_SOCKET
+
+
+# Minimal Docker Engine API client speaking HTTP over the daemon's unix socket.
+# Connections are kept alive and reused from a small pool, so a test costs a
+# handful of requests instead of one docker CLI process per operation.
+class DockerClient():
+    def __init__(self, socket_path=None, pool_size=8):
+        self.socket_path = socket_path if socket_path is not None else get_socket_path()
+        self.pool = queue.LifoQueue(maxsize=pool_size)
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _get_connection(self, timeout):
+        try:
+            conn = self.pool.get_nowait()
+        except queue.Empty:
+            conn = UnixHTTPConnection(self.socket_path)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def _put_connection(self, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        try:
+            self.pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _send(self, method, path, params=None, body=None, timeout=None):
+        url = f'/{API_VERSION}{path}'
+        if params:
+            url = f'{url}?{urlencode(params)}'
+        headers = {}
+        if body is not None:
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        conn = self._get_connection(timeout)
+        try:
+            conn.request(method, url, body=body, headers=headers)
+            response = conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+        if response.status >= 400:
+            data = response.read()
+            self._put_connection(conn, response)
+            try:
+                message = json.loads(data)['message']
+            except (ValueError, KeyError):
+                message = data.decode('utf-8', errors='replace')
+            raise DockerAPIError(response.status, message)
+        return conn, response
+
+    def _request(self, method, path, params=None, body=None, timeout=None):
+        conn, response = self._send(method, path, params=params, body=body, timeout=timeout)
+        try:
+            data = response.read()
+        except Exception:
+            conn.close()
+            raise
+        self._put_connection(conn, response)
+        if len(data) == 0:
+            return None
+        return json.loads(data)
+
+    def create_container(self, image, cmd, env={}, binds=[], name=None, init=False):
+        body = {
+            'Image': image,
+            'Cmd': cmd,
+            'Env': [f'{key}={value}' for key, value in env.items()],
+            'HostConfig': {'Binds': binds, 'Init': init},
+        }
+        params = {'name': name} if name is not None else None
+        return self._request('POST', '/containers/create', params=params, body=body)['Id']
+
+    def start_container(self, container_id):
+        self._request('POST', f'/containers/{quote(container_id)}/start')
+
+    def run_container(self, image, cmd, env={}, binds=[], init=False):
+        container_id = self.create_container(image, cmd, env=env, binds=binds, init=init)
+        self.start_container(container_id)
+        return container_id
+
+    def wait_container(self, container_id, timeout=None):
+        # returns the exit code, or None if the container is still running after timeout seconds
+        try:
+            data = self._request('POST', f'/containers/{quote(container_id)}/wait', timeout=timeout)
+        except socket.timeout:
+            return None
+        return data['StatusCode']
+
+    def inspect_container(self, container_id):
+        return self._request('GET', f'/containers/{quote(container_id)}/json')
+
+    def stop_container(self, container_id, timeout=10):
+        self._request('POST', f'/containers/{quote(container_id)}/stop', params={'t': timeout})
+
+    def remove_container(self, container_id, force=False):
+        params = {'force': 1} if force else None
+        self._request('DELETE', f'/containers/{quote(container_id)}', params=params)
+
+    def inspect_image(self, image):
+        return self._request('GET', f'/images/{quote(image)}/json')
+
+    def _iter_frames(self, conn, response):
+        # containers created without a tty multiplex stdout and stderr: every frame
+        # is an 8 byte header (stream type, 3 padding bytes, big-endian size) plus payload
+        try:
+            while True:
+                header = response.read(8)
+                if len(header) < 8:
+                    break
+                _, size = struct.unpack('>BxxxL', header)
+                payload = response.read(size)
+                if len(payload) == 0:
+                    break
+                yield payload
+        except Exception:
+            conn.close()
+            raise
+        self._put_connection(conn, response)
+
+    def iter_logs(self, container_id):
+        params = {'stdout': 1, 'stderr': 1}
+        conn, response = self._send('GET', f'/containers/{quote(container_id)}/logs', params=params)
+        yield from self._iter_frames(conn, response)
+
+    def logs(self, container_id):
+        return b''.join(self.iter_logs(container_id)).decode('utf-8', errors='replace')
+
+    def create_exec(self, container_id, cmd, env={}):
+        body = {
+            'Cmd': cmd,
+            'Env': [f'{key}={value}' for key, value in env.items()],
+            'AttachStdout': True,
+            'AttachStderr': True,
+        }
+        return self._request('POST', f'/containers/{quote(container_id)}/exec', body=body)['Id']
+
+    def iter_exec(self, exec_id):
+        # starts the exec and yields its output until the command exits
+        conn, response = self._send('POST', f'/exec/{quote(exec_id)}/start', body={'Detach': False, 'Tty': False})
+        yield from self._iter_frames(conn, response)
+
+    def inspect_exec(self, exec_id):
+        return self._request('GET', f'/exec/{quote(exec_id)}/json')
+
+    def exec_exit_code(self, exec_id, timeout=10):
+        # the output stream can end a moment before the daemon records the exit code
+        deadline = time.time() + timeout
+        while True:
+            info = self.inspect_exec(exec_id)
+            if not info['Running'] or time.time() > deadline:
+                return info['ExitCode']
+            time.sleep(0.05)
+
+    def run_exec(self, container_id, cmd, env={}):
+        # runs a command in a running container and returns its exit code and output
+        exec_id = self.create_exec(container_id, cmd, env=env)
+        output = b''.join(self.iter_exec(exec_id)).decode('utf-8', errors='replace')
+        return self.exec_exit_code(exec_id), output
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import time
+import queue
+import shutil
+import signal
+import struct
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.server
+import socketserver
+from urllib.parse import urlsplit, parse_qs
+
+# paths of the container filesystem that are not bind mounts, kept in the directory of the container
+PRIVATE_PATHS = ['/venvs', '/venv-base', '/root', '/var/cache']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Docker Engine API on a unix socket, running containers as local processes")
+    parser.add_argument('--socket', type=str, help="path of the unix socket to listen on", required=True)
+    args = parser.parse_args()
+
+    fake = FakeDocker(args.socket)
+    fake.start()
+    print(f"serving a fake Engine API on {args.socket}, use DOCKER_HOST=unix://{args.socket}; press Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    fake.stop()
+
+
+def frame(stream, data):
+    # the multiplexed stream format of containers without a tty
+    return struct.pack('>BxxxL', stream, len(data)) + data
+
+
+def kill_group(process, sig):
+    # every process runs in a session of its own, so this reaches the children it started too
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def exit_code(returncode):
+    # a process killed by a signal exits like it does under a shell
+    return 128 - returncode if returncode < 0 else returncode
+
+
+# The endpoints of the Docker Engine API docker-api.py uses, on a unix socket, for testing the
+# harness without a Docker daemon. A container is a temporary directory standing in for its
+# filesystem plus a local process running its command; an exec is another process of the same
+# container. Absolute paths in commands and environment values are mapped to the host: paths
+# under a bind mount to the bound host directory, PRIVATE_PATHS to the container directory
+# (HOME is its /root), anything else is left alone, so the commands run with the tools of the
+# host. An image may be given a directory that is copied into each of its containers.
+class FakeDocker():
+    def __init__(self, socket_path, images=None):
+        self.socket_path = socket_path
+        # image -> directory with its files (or None), or None to accept any image
+        self.images = images
+        self.containers = {}
+        self.execs = {}
+        self.lock = threading.Lock()
+        self.count = 0
+        self.server = None
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        handler = type('Handler', (FakeDockerHandler,), {'fake': self})
+        self.server = FakeDockerServer(self.socket_path, handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for container in list(self.containers.values()):
+            self.kill(container)
+            shutil.rmtree(container['root'], ignore_errors=True)
+        self.containers = {}
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def new_id(self):
+        with self.lock:
+            self.count += 1
+            return hashlib.sha256(f'{id(self)}-{self.count}'.encode('utf-8')).hexdigest()
+
+    def image_info(self, image):
+        if self.images is not None and image not in self.images:
+            return None
+        return {
+            'Id': 'sha256:' + hashlib.sha256(image.encode('utf-8')).hexdigest(),
+            'Created': '2026-01-01T00:00:00.000000000Z',
+            'Config': {'Labels': {}},
+        }
+
+    def create_container(self, body):
+        image = body['Image']
+        if self.image_info(image) is None:
+            return None
+        root = tempfile.mkdtemp(prefix='fake-container-')
+        image_dir = self.images.get(image) if self.images is not None else None
+        if image_dir is not None:
+            shutil.copytree(image_dir, root, symlinks=True, dirs_exist_ok=True)
+        os.makedirs(f'{root}/root', exist_ok=True)
+        binds = []
+        for bind in body.get('HostConfig', {}).get('Binds') or []:
+            host, target = bind.split(':')[:2]
+            binds.append((host, target))
+        container = {
+            'id': self.new_id(),
+            'image': image,
+            'cmd': body['Cmd'],
+            'env': dict(item.split('=', 1) for item in body.get('Env') or []),
+            'binds': sorted(binds, key=lambda bind: len(bind[1]), reverse=True),
+            'init': body.get('HostConfig', {}).get('Init', False),
+            'root': root,
+            'process': None,
+            'output': [],
+            'exit-code': None,
+            'done': threading.Event(),
+        }
+        self.containers[container['id']] = container
+        return container
+
+    def map_path(self, container, value):
+        for host, target in container['binds']:
+            if value == target or value.startswith(f'{target}/'):
+                return host + value[len(target):]
+        for prefix in PRIVATE_PATHS:
+            if value == prefix or value.startswith(f'{prefix}/'):
+                return container['root'] + value
+        return value
+
+    def spawn(self, container, cmd, env={}):
+        process_env = {'PATH': os.environ['PATH'], 'HOME': f"{container['root']}/root"}
+        for key, value in {**container['env'], **env}.items():
+            process_env[key] = self.map_path(container, value) if value.startswith('/') else value
+        return subprocess.Popen([self.map_path(container, arg) for arg in cmd], env=process_env, cwd=container['root'],
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+
+    def read_output(self, process, output):
+        # puts (stream, data) for stdout (1) and stderr (2) as they arrive, and None at the end of both
+        def read(stream, f):
+            while data := f.read1(64 * 1024):
+                output.put((stream, data))
+            output.put((stream, None))
+        for stream, f in [(1, process.stdout), (2, process.stderr)]:
+            threading.Thread(target=read, args=(stream, f), daemon=True).start()
+
+    def start_container(self, container):
+        if container['process'] is not None:
+            return
+        container['process'] = self.spawn(container, container['cmd'])
+        output = queue.Queue()
+        self.read_output(container['process'], output)
+
+        def collect():
+            ended = 0
+            while ended < 2:
+                stream, data = output.get()
+                if data is None:
+                    ended += 1
+                else:
+                    container['output'].append((stream, data))
+            container['exit-code'] = exit_code(container['process'].wait())
+            container['done'].set()
+        threading.Thread(target=collect, daemon=True).start()
+
+    def running(self, container):
+        return container['process'] is not None and not container['done'].is_set()
+
+    def kill(self, container, timeout=0):
+        # the execs of a container end with it; its command gets SIGTERM, and SIGKILL after timeout seconds
+        for exec_info in list(self.execs.values()):
+            if exec_info['container'] is container and exec_info['process'] is not None:
+                kill_group(exec_info['process'], signal.SIGKILL)
+        if not self.running(container):
+            return
+        kill_group(container['process'], signal.SIGTERM)
+        if not container['done'].wait(timeout):
+            kill_group(container['process'], signal.SIGKILL)
+            container['done'].wait(10)
+
+    def container_info(self, container):
+        running = self.running(container)
+        status = 'running' if running else 'exited' if container['done'].is_set() else 'created'
+        return {
+            'Id': container['id'],
+            'Image': container['image'],
+            'State': {'Status': status, 'Running': running, 'ExitCode': container['exit-code'] or 0},
+            'Config': {'Cmd': container['cmd'], 'Env': [f'{key}={value}' for key, value in container['env'].items()]},
+            'HostConfig': {'Binds': [f'{host}:{target}' for host, target in container['binds']], 'Init': container['init']},
+        }
+
+    def remove_container(self, container):
+        self.kill(container)
+        del self.containers[container['id']]
+        for exec_id in [exec_id for exec_id, exec_info in self.execs.items() if exec_info['container'] is container]:
+            del self.execs[exec_id]
+        shutil.rmtree(container['root'], ignore_errors=True)
+
+    def create_exec(self, container, body):
+        exec_info = {
+            'id': self.new_id(),
+            'container': container,
+            'cmd': body['Cmd'],
+            'env': dict(item.split('=', 1) for item in body.get('Env') or []),
+            'process': None,
+            'exit-code': None,
+            'done': threading.Event(),
+        }
+        self.execs[exec_info['id']] = exec_info
+        return exec_info
+
+    def iter_exec(self, exec_info):
+        # runs the exec and yields its output frames as they arrive
+        exec_info['process'] = self.spawn(exec_info['container'], exec_info['cmd'], exec_info['env'])
+        output = queue.Queue()
+        self.read_output(exec_info['process'], output)
+        ended = 0
+        while ended < 2:
+            stream, data = output.get()
+            if data is None:
+                ended += 1
+            else:
+                yield frame(stream, data)
+        exec_info['exit-code'] = exit_code(exec_info['process'].wait())
+        exec_info['done'].set()
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects an (address, port) pair
+        request, _ = super().get_request()
+        return request, ('localhost', 0)
+
+
+class FakeDockerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8') if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_message(self, status, message):
+        self.send_json({'message': message}, status=status)
+
+    def parse_request_path(self):
+        parts = urlsplit(self.path)
+        path = re.sub(r'^/v[0-9.]+/', '/', parts.path)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length)) if length > 0 else {}
+        return path, params, body
+
+    def get_container(self, container_id):
+        container = self.fake.containers.get(container_id)
+        if container is None:
+            self.send_message(404, f'No such container: {container_id}')
+        return container
+
+    def do_GET(self):
+        path, params, body = self.parse_request_path()
+        if mo := re.match(r'^/containers/([^/]+)/json$', path):
+            if container := self.get_container(mo.group(1)):
+                self.send_json(self.fake.container_info(container))
+        elif mo := re.match(r'^/containers/([^/]+)/logs$', path):
+            if container := self.get_container(mo.group(1)):
+                streams = {stream for stream, key in [(1, 'stdout'), (2, 'stderr')] if params.get(key) in ['1', 'true']}
+                body = b''.join(frame(stream, data) for stream, data in list(container['output']) if stream in streams)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/vnd.docker.multiplexed-stream')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        elif mo := re.match(r'^/exec/([^/]+)/json$', path):
+            exec_info = self.fake.execs.get(mo.group(1))
+            if exec_info is None:
+                self.send_message(404, f'No such exec instance: {mo.group(1)}')
+                return
+            running = exec_info['process'] is not None and not exec_info['done'].is_set()
+            self.send_json({'ID': exec_info['id'], 'Running': running, 'ExitCode': exec_info['exit-code']})
+        elif mo := re.match(r'^/images/(.+)/json$', path):
+            image_info = self.fake.image_info(mo.group(1))
+            if image_info is None:
+                self.send_message(404, f'No such image: {mo.group(1)}')
+                return
+            self.send_json(image_info)
+        else:
+            self.send_message(404, f'page not found: {path}')
+
+    def do_POST(self):
+        path, params, body = self.parse_request_path()
+        if path == '/containers/create':
+            container = self.fake.create_container(body)
+            if container is None:
+                self.send_message(404, f"No such image: {body['Image']}")
+                return
+            self.send_json({'Id': container['id'], 'Warnings': []}, status=201)
+        elif mo := re.match(r'^/containers/([^/]+)/start$', path):
+            if container := self.get_container(mo.group(1)):
+                self.fake.start_container(container)
+                self.send_json(None, status=204)
+        elif mo := re.match(r'^/containers/([^/]+)/wait$', path):
+            if container := self.get_container(mo.group(1)):
+                self.wait_container(container)
+        elif mo := re.match(r'^/containers/([^/]+)/stop$', path):
+            if container := self.get_container(mo.group(1)):
+                running = self.fake.running(container)
+                self.fake.kill(container, timeout=float(params.get('t', 10)))
+                self.send_json(None, status=204 if running else 304)
+        elif mo := re.match(r'^/containers/([^/]+)/exec$', path):
+            if container := self.get_container(mo.group(1)):
+                if not self.fake.running(container):
+                    self.send_message(409, f'Container {container["id"]} is not running')
+                    return
+                self.send_json({'Id': self.fake.create_exec(container, body)['id']}, status=201)
+        elif mo := re.match(r'^/exec/([^/]+)/start$', path):
+            exec_info = self.fake.execs.get(mo.group(1))
+            if exec_info is None:
+                self.send_message(404, f'No such exec instance: {mo.group(1)}')
+                return
+            # like the daemon, the connection is taken over by the raw stream until the exec ends
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.docker.multiplexed-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for data in self.fake.iter_exec(exec_info):
+                    self.wfile.write(data)
+                    self.wfile.flush()
+            except BrokenPipeError:
+                pass
+        else:
+            self.send_message(404, f'page not found: {path}')
+
+    def do_DELETE(self):
+        path, params, body = self.parse_request_path()
+        if mo := re.match(r'^/containers/([^/]+)$', path):
+            if container := self.get_container(mo.group(1)):
+                if self.fake.running(container) and params.get('force') not in ['1', 'true']:
+                    self.send_message(409, f'cannot remove container {container["id"]}: container is running')
+                    return
+                self.fake.remove_container(container)
+                self.send_json(None, status=204)
+        else:
+            self.send_message(404, f'page not found: {path}')
+
+    def wait_container(self, container):
+        # like the daemon, the headers go out at once and the body only when the container exits
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.wfile.flush()
+        container['done'].wait()
+        body = json.dumps({'StatusCode': container['exit-code'], 'Error': None}).encode('utf-8') + b'\n'
+        try:
+            self.wfile.write(f'{len(body):x}\r\n'.encode('ascii') + body + b'\r\n0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting
+            self.close_connection = True
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import re
+import json
+import time
+import zipfile
+import argparse
+import threading
+import http.server
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+
+API_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# GitHub keeps artifacts for 90 days unless the repository says otherwise
+ARTIFACT_RETENTION_DAYS = 90
+CHUNK_SIZE = 64 * 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake GitHub artifacts API holding results files, for running generate-website.py without GitHub")
+    parser.add_argument('--port', type=int, default=8080, help="port to listen on")
+    parser.add_argument('--repository', type=str, default='owner/repo', help="name of the repository the artifacts belong to")
+    parser.add_argument('results', nargs='*', help="results files, each served as the artifact of a run at its modification time")
+    args = parser.parse_args()
+
+    fake = FakeGitHub()
+    for fname in args.results:
+        with open(fname, 'rb') as f:
+            created_at = datetime.utcfromtimestamp(os.path.getmtime(fname))
+            fake.add_artifact(created_at, files={os.path.basename(fname): f.read()})
+    fake.start('127.0.0.1', args.port)
+    print(f"serving a fake GitHub API on {fake.url}, use GITHUB_API_URL={fake.url} GITHUB_REPOSITORY={args.repository}; press Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    fake.stop()
+
+
+def zip_files(files):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as zf:
+        for fname, content in files.items():
+            zf.writestr(fname, content)
+    return data.getvalue()
+
+
+# The endpoints of the GitHub REST API generate-website.py uses to find the results of previous
+# runs: the artifact listing of a repository, newest first and paginated with Link headers, and
+# the download of an artifact, which redirects to the zip like GitHub does. Expired artifacts are
+# listed but their downloads are gone. Any repository name is accepted, and every request path
+# is kept in requests for the tests to check what was fetched.
+class FakeGitHub():
+    def __init__(self, max_per_page=100):
+        self.max_per_page = max_per_page
+        self.artifacts = []
+        self.zips = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self, host='127.0.0.1', port=0):
+        handler = type('Handler', (FakeGitHubHandler,), {'fake': self})
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def add_artifact(self, created_at, files=None, data=None, name='results', expired=False):
+        # the zip holds files (name -> content), or is data as given, to serve a damaged one
+        with self.lock:
+            artifact_id = len(self.artifacts) + 1
+            self.zips[artifact_id] = data if data is not None else zip_files(files or {})
+            artifact = {
+                'id': artifact_id,
+                'name': name,
+                'size_in_bytes': len(self.zips[artifact_id]),
+                'archive_download_url': None,
+                'expired': expired,
+                'created_at': created_at.strftime(API_DATE_FORMAT),
+                'updated_at': created_at.strftime(API_DATE_FORMAT),
+                'expires_at': (created_at + timedelta(days=ARTIFACT_RETENTION_DAYS)).strftime(API_DATE_FORMAT),
+            }
+            self.artifacts.append(artifact)
+        return artifact
+
+    def list_artifacts(self, repository):
+        # the urls are only known once the server runs
+        artifacts = sorted(self.artifacts, key=lambda artifact: (artifact['created_at'], artifact['id']), reverse=True)
+        return [dict(artifact, archive_download_url=f"{self.url}/repos/{repository}/actions/artifacts/{artifact['id']}/zip")
+                for artifact in artifacts]
+
+
+class FakeGitHubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200, headers={}):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_message(self, status, message):
+        self.send_json({'message': message}, status=status)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        with self.fake.lock:
+            self.fake.requests.append(self.path)
+        if mo := re.match(r'^/repos/([^/]+/[^/]+)/actions/artifacts$', parts.path):
+            self.send_artifact_page(mo.group(1), params)
+        elif mo := re.match(r'^/repos/[^/]+/[^/]+/actions/artifacts/([0-9]+)/zip$', parts.path):
+            artifact = next((artifact for artifact in self.fake.artifacts if artifact['id'] == int(mo.group(1))), None)
+            if artifact is None:
+                self.send_message(404, 'Not Found')
+            elif artifact['expired']:
+                self.send_message(410, 'Artifact has expired')
+            else:
+                self.send_response(302)
+                self.send_header('Location', f"{self.fake.url}/blobs/{artifact['id']}.zip")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+        elif mo := re.match(r'^/blobs/([0-9]+)\.zip$', parts.path):
+            data = self.fake.zips.get(int(mo.group(1)))
+            if data is None:
+                self.send_message(404, 'Not Found')
+                return
+            # chunked, so the client has to stream it
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/zip')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for start in range(0, len(data), CHUNK_SIZE):
+                chunk = data[start:start + CHUNK_SIZE]
+                self.wfile.write(f'{len(chunk):x}\r\n'.encode('ascii') + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.send_message(404, 'Not Found')
+
+    def send_artifact_page(self, repository, params):
+        try:
+            per_page = min(int(params.get('per_page', 30)), self.fake.max_per_page)
+            page = int(params.get('page', 1))
+        except ValueError:
+            self.send_message(422, 'Invalid request')
+            return
+        artifacts = self.fake.list_artifacts(repository)
+        start = (page - 1) * per_page
+        headers = {}
+        if start + per_page < len(artifacts):
+            url = f'{self.fake.url}/repos/{repository}/actions/artifacts'
+            headers['Link'] = f'<{url}?per_page={per_page}&page={page + 1}>; rel="next", <{url}?per_page={per_page}&page=1>; rel="first"'
+        self.send_json({'total_count': len(artifacts), 'artifacts': artifacts[start:start + per_page]}, headers=headers)
+
+
+if __name__ == '__main__':
+    main()
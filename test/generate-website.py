@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
 
-import io
 import os
+import glob
 import json
+import shutil
+import hashlib
 import zipfile
 import argparse
 import requests
 import tempfile
 import importlib
 import subprocess
+import concurrent.futures
+import requests.adapters
 from datetime import datetime, timedelta
 
 process_results = importlib.import_module("process-results")
+results_db = importlib.import_module("results-db")
+log_store = importlib.import_module("log-store")
+wheel_pages = importlib.import_module("wheel-pages")
+
+API_DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# artifacts downloaded at once from the GitHub API
+DOWNLOAD_THREADS = 4
 
 def main():
     parser = argparse.ArgumentParser(description="Generate the static website")
@@ -23,91 +34,260 @@ def main():
     parser.add_argument('--github-token', type=str, help="github api token", required=True)
     parser.add_argument('--compare-weekday-num', type=int, help="integer weekday number to hinge the summary report on", default=None)
     parser.add_argument('--ignore', type=str, action='append', help='Ignore tests with the specified name; can be used more than once.', default=[])
+    parser.add_argument('--history-db', type=str, help="history database to add the new results to and to read previous runs from", default=None)
+    parser.add_argument('--artifact-cache-dir', type=str, help="directory to keep the downloaded previous results in between runs", default=None)
+    parser.add_argument('--cache-dir', type=str, help="directory to keep the package ranks and parsed result files in between runs", default=None)
+    parser.add_argument('--report-format', type=str, choices=['html', 'data'], default='html',
+            help="'data' publishes the results as report.json with a page that renders only the rows in view")
 
     args = parser.parse_args()
 
     generate_website(args.output_dir, args.new_results, args.github_token, args.compare_n_days_ago,
             repo_path=args.repo, website_branch=args.website_branch, compare_weekday_num=args.compare_weekday_num,
-            ignore_tests=args.ignore)
+            ignore_tests=args.ignore, history_db=args.history_db, report_format=args.report_format,
+            artifact_cache_dir=args.artifact_cache_dir, cache_dir=args.cache_dir)
 
 def generate_website(output_dir, new_results, github_token, days_ago_list=[], repo_path="/repo", website_branch="gh-pages",
-        compare_weekday_num=None, ignore_tests=[]):
-    # TODO: checkout the existing gh-pages and update it with a new report rather than replacing it completely
-    # clone the repo to a temporary directory and checkout the website branch
-    #webrepo = tempfile.mkdtemp()
-    #subprocess.run(f'git clone --no-checkout -b {website_branch} {repo_path} {webrepo}', shell=True)
-
-    # download results from previous run
-    previous_results = fetch_previous_results(days_ago_list, github_token=github_token)
+        compare_weekday_num=None, ignore_tests=[], history_db=None, report_format='html',
+        artifact_cache_dir=None, cache_dir=None):
+    # The site is updated in place: when output_dir still holds the previous build, only the
+    # report and the pages of the wheels whose results changed are written again.
+    os.makedirs(output_dir, exist_ok=True)
 
+    history = None
     results = [new_results]
-    results.extend(previous_results)
-    html = process_results.print_table_by_distro_report(results, compare_weekday_num=compare_weekday_num, ignore_tests=ignore_tests)
+    if history_db is not None:
+        history = results_db.ResultsDB(history_db)
+        if len(history) == 0:
+            # seed a new database with the previous runs still available as artifacts
+            for fname in fetch_previous_results(days_ago_list, github_token=github_token, cache_dir=artifact_cache_dir):
+                history.import_results_file(fname)
+        history.import_results_file(new_results)
+    else:
+        # download results from previous run
+        previous_results = fetch_previous_results(days_ago_list, github_token=github_token, cache_dir=artifact_cache_dir)
+        results.extend(previous_results)
+    data = None
+    if report_format == 'data':
+        html, data = process_results.print_data_report(results, 'report.json', compare_weekday_num=compare_weekday_num,
+                ignore_tests=ignore_tests, history_db=history, wheel_pages=True, cache_dir=cache_dir)
+    else:
+        html = process_results.print_table_by_distro_report(results, compare_weekday_num=compare_weekday_num, ignore_tests=ignore_tests,
+                history_db=history, wheel_pages=True, cache_dir=cache_dir)
+
+    pages = wheel_pages.WheelPages(output_dir)
+    new_results_file = process_results.load_test_result_file(new_results, cache_dir=cache_dir)
+    if pages.last_run is not None and new_results_file.date > pages.last_run:
+        pages.add_test_result_file(new_results_file)
+    else:
+        # no previous build to continue from, rebuild the pages from all the history there is
+        pages.reset()
+        if history is not None:
+            for date, wheel_results in history.iter_runs():
+                pages.add_run(date, wheel_results)
+        else:
+            for test_result_file in sorted(process_results.load_test_result_files(results, cache_dir=cache_dir), key=lambda x: x.date):
+                pages.add_test_result_file(test_result_file)
+    print(f"wrote {pages.write()} wheel pages")
+    peak, workers_peak = process_results.get_peak_rss()
+    print(f"peak RSS of the report generation: {peak:.0f} MB, {workers_peak:.0f} MB in the parser processes")
+    if history is not None:
+        history.close()
 
-    try:
-        os.mkdir(output_dir)
-    except FileExistsError:
-        pass
     with open(f'{output_dir}/index.html', 'w') as f:
         f.write(html)
+    if data is not None:
+        with open(f'{output_dir}/report.json', 'w') as f:
+            f.write(data)
+
+    # the report links to the logs of the new results, which test-packages.py left next to them
+    # and only to those, so the logs of earlier builds are removed
+    log_hashes = log_store.get_log_hashes(new_results_file.content)
+    log_store.copy_logs(f'{os.path.dirname(os.path.abspath(new_results))}/logs', log_hashes, f'{output_dir}/logs')
+    log_store.remove_unreferenced_logs(f'{output_dir}/logs', log_hashes)
+
+
+
+def list_artifacts(session, url, oldest):
+    # the listing is paginated and sorted newest first, so stop at the first page that
+    # reaches back past the oldest artifact of interest
+    artifacts = []
+    params = {'per_page': 100}
+    while url is not None:
+        r = session.get(url, params=params, timeout=60)
+        r.raise_for_status()
+        page = r.json()['artifacts']
+        artifacts.extend(page)
+        if any(datetime.strptime(artifact['created_at'], API_DATE_FORMAT) < oldest for artifact in page):
+            break
+        # the next link already carries the query parameters
+        url = r.links.get('next', {}).get('url')
+        params = None
+    return artifacts
+
+
+def download_artifact_results(session, artifact, dest_dir):
+    # the zip is streamed to disk rather than held in memory, and its first xz member is
+    # extracted next to it
+    url = artifact['archive_download_url']
+    with tempfile.TemporaryFile(dir=dest_dir) as zip_f:
+        with session.get(url, stream=True, timeout=300) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=1024 * 1024):
+                zip_f.write(chunk)
+        try:
+            zf = zipfile.ZipFile(zip_f)
+        except zipfile.BadZipFile:
+            print(f"Bad zip file at {url}. Skipping.")
+            return None
+        with zf:
+            for fname in zf.namelist():
+                if fname[-3:] == '.xz':
+                    result_fname = f'{dest_dir}/{os.path.basename(fname)}'
+                    with zf.open(fname) as f, open(result_fname, 'wb') as dest_f:
+                        shutil.copyfileobj(f, dest_f)
+                    return result_fname
+    return None
+
+
+def file_sha256(fname):
+    sha256 = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        while data := f.read(1024 * 1024):
+            sha256.update(data)
+    return sha256.hexdigest()
+
 
+# Results files extracted from artifacts, kept across website builds. Every artifact gets a
+# directory named after its id and creation time, holding the results file and a manifest
+# with its name and sha256; an entry whose file does not match its manifest is downloaded again.
+class ArtifactCache():
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.stats = {'hits': 0, 'misses': 0, 'pruned': 0}
+        os.makedirs(cache_dir, exist_ok=True)
 
+    def entry_dir(self, artifact):
+        created_at = datetime.strptime(artifact['created_at'], API_DATE_FORMAT)
+        return f"{self.cache_dir}/{artifact['id']}-{created_at.strftime('%Y%m%dT%H%M%S')}"
 
-def fetch_previous_results(days_ago_list, github_token):
+    def lookup(self, artifact):
+        entry_dir = self.entry_dir(artifact)
+        try:
+            with open(f'{entry_dir}/manifest.json') as f:
+                manifest = json.load(f)
+            result_fname = f"{entry_dir}/{manifest['fname']}"
+            if file_sha256(result_fname) == manifest['sha256']:
+                self.stats['hits'] += 1
+                return result_fname
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        if os.path.exists(entry_dir):
+            print(f"artifact cache entry {entry_dir} is damaged, downloading it again")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+        self.stats['misses'] += 1
+        return None
+
+    def download(self, session, artifact):
+        staging_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        try:
+            result_fname = download_artifact_results(session, artifact, staging_dir)
+            if result_fname is None:
+                return None
+            manifest = {'fname': os.path.basename(result_fname), 'sha256': file_sha256(result_fname)}
+            with open(f'{staging_dir}/manifest.json', 'w') as f:
+                json.dump(manifest, f)
+            entry_dir = self.entry_dir(artifact)
+            os.rename(staging_dir, entry_dir)
+            return f"{entry_dir}/{manifest['fname']}"
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def prune(self, oldest, keep=[]):
+        # removes the entries of artifacts created before oldest, except those in keep
+        keep = set(self.entry_dir(artifact) for artifact in keep)
+        for entry_dir in glob.glob(f'{self.cache_dir}/*-*'):
+            try:
+                created_at = datetime.strptime(entry_dir.rsplit('-', 1)[1], '%Y%m%dT%H%M%S')
+            except ValueError:
+                continue
+            if created_at < oldest and entry_dir not in keep:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                self.stats['pruned'] += 1
+
+    def print_stats(self):
+        print(f"artifact cache: {self.stats['hits']} hits, {self.stats['misses']} misses, {self.stats['pruned']} pruned")
+
+
+def fetch_previous_results(days_ago_list, github_token, cache_dir=None, prune_cache=True):
+    # with a cache_dir, artifacts downloaded before are read from an ArtifactCache there,
+    # which is pruned down to the oldest day of days_ago_list unless prune_cache is False
     if len(days_ago_list) == 0:
         return []
 
-    api_date_format = '%Y-%m-%dT%H:%M:%SZ'
     try:
         github_repo = os.environ['GITHUB_REPOSITORY']
         github_api_url = os.environ['GITHUB_API_URL']
     except KeyError:
         return []
 
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_THREADS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept'] = 'application/vnd.github.v3+json'
+    if github_token:
+        session.headers['Authorization'] = f'Bearer {github_token}'
+
+    now = datetime.utcnow()
+    days_ago_list = sorted(days_ago_list, reverse=True)
+    oldest = now - timedelta(days=days_ago_list[0])
     url = f'{github_api_url}/repos/{github_repo}/actions/artifacts'
     try:
-        r = requests.get(url, headers={'Accept': 'application/vnd.github.v3+json'})
-    except requests.RequestsError:
+        artifacts = list_artifacts(session, url, oldest=oldest)
+    except (requests.RequestException, ValueError, KeyError):
         print("failed to read from github api")
         return []
 
-    response_data = r.json()
-    days_ago_list = sorted(days_ago_list, reverse=True)
-    artifacts = sorted(response_data['artifacts'], reverse=True, key=lambda x: datetime.strptime(x['created_at'], api_date_format))
-    now = datetime.utcnow()
+    artifacts = [artifact for artifact in artifacts if not artifact.get('expired', False)]
+    artifacts = sorted(artifacts, reverse=True, key=lambda x: datetime.strptime(x['created_at'], API_DATE_FORMAT))
     results = []
     for artifact in artifacts:
         if len(days_ago_list) == 0:
             break
-        created_at = datetime.strptime(artifact['created_at'], api_date_format)
+        created_at = datetime.strptime(artifact['created_at'], API_DATE_FORMAT)
         if now - timedelta(days=days_ago_list[-1]) > created_at:
             results.append(artifact)
             days_ago_list.pop()
 
+    cache = ArtifactCache(cache_dir) if cache_dir is not None else None
+    if cache is not None and prune_cache:
+        cache.prune(oldest, keep=results)
     if len(results) == 0:
         return []
 
-    result_fnames = []
-    previous_results_dir = tempfile.mkdtemp()
-    for previous_result in results:
-        url = previous_result['archive_download_url']
-        r = requests.get(url, headers={'Accept': 'application/vnd.github.v3+json', 'Authorization': f'Bearer {github_token}'})
-        try:
-            zf = zipfile.ZipFile(io.BytesIO(r.content))
-        except zipfile.BadZipFile:
-            print(f"Bad zip file at {previous_result['archive_download_url']}. Skipping.")
-            continue
-
-        # find the first xz file
-        for fname in zf.namelist():
-            if fname[-3:] == '.xz':
-                with zf.open(fname) as f:
-                    result_fname = f'{previous_results_dir}/{fname}'
-                    with open(result_fname, 'wb') as dest_f:
-                        dest_f.write(f.read())
-                    result_fnames.append(result_fname)
-                break
-
+    previous_results_dir = tempfile.mkdtemp() if cache is None else None
+    with concurrent.futures.ThreadPoolExecutor(max_workers=DOWNLOAD_THREADS) as executor:
+        futures = []
+        for previous_result in results:
+            if cache is None:
+                futures.append(executor.submit(download_artifact_results, session, previous_result, previous_results_dir))
+            elif (cached_fname := cache.lookup(previous_result)) is not None:
+                futures.append(cached_fname)
+            else:
+                futures.append(executor.submit(cache.download, session, previous_result))
+        result_fnames = []
+        for previous_result, future in zip(results, futures):
+            try:
+                result_fname = future.result() if isinstance(future, concurrent.futures.Future) else future
+            except requests.RequestException as e:
+                print(f"failed to download {previous_result['archive_download_url']}: {e}. Skipping.")
+                continue
+            if result_fname is not None:
+                result_fnames.append(result_fname)
+    session.close()
+    if cache is not None:
+        cache.print_stats()
 
     return result_fnames
 
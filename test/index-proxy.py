@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import time
+import glob
+import base64
+import shutil
+import socket
+import hashlib
+import argparse
+import tempfile
+import threading
+import http.server
+import urllib.error
+import urllib.request
+from html import escape as html_escape
+from urllib.parse import urljoin, urldefrag, urlsplit, unquote
+
+DEFAULT_UPSTREAM = 'https://pypi.org/simple/'
+DEFAULT_PORT = 3141
+# project pages change whenever something is released; only the artifacts they link to are immutable
+PAGE_TTL = 600
+# seconds an upstream request may stall before the proxy gives up on it and answers with an error
+UPSTREAM_TIMEOUT = 60
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a caching PyPI simple index proxy")
+    parser.add_argument('--cache-dir', type=str, help="directory for cached artifacts", required=True)
+    parser.add_argument('--upstream', type=str, help="upstream simple index URL, or a local directory of wheels and sdists", default=DEFAULT_UPSTREAM)
+    parser.add_argument('--port', type=int, help="port to listen on", default=DEFAULT_PORT)
+    parser.add_argument('--max-size', type=float, help="size limit of the artifact cache, in GB", default=20)
+    args = parser.parse_args()
+
+    proxy = IndexProxy(args.cache_dir, args.upstream, int(args.max_size * 1024**3))
+    proxy.start('0.0.0.0', args.port)
+    print(f"serving {args.upstream} on port {args.port}, press Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    proxy.stop()
+    proxy.print_stats()
+
+
+def canonical_name(name):
+    # PEP 503 normalization
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def get_project_name(fname):
+    # the canonical project name of a wheel or sdist file name, None for anything else
+    if fname.endswith('.whl'):
+        return canonical_name(fname.split('-')[0])
+    for extension in ['.tar.gz', '.tar.bz2', '.tgz', '.zip']:
+        if fname.endswith(extension):
+            return canonical_name(fname[:-len(extension)].rsplit('-', 1)[0])
+    return None
+
+
+def encode_base_url(url):
+    return base64.urlsafe_b64encode(url.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_base_url(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4)).decode('utf-8')
+
+
+def get_origin(url):
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}'
+
+
+def get_host_address():
+    # the address other containers can reach us on; connecting a UDP socket sends nothing
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect(('10.255.255.255', 1))
+        return s.getsockname()[0]
+
+
+# A PEP 503 simple index that forwards project pages from the upstream index, with every
+# file link rewritten to point back at the proxy. Linked artifacts are stored on disk under
+# the hash of their upstream URL and served from there on every later request; the least
+# recently used ones are evicted once the cache grows past max_bytes. A local directory
+# upstream goes through the same cache, so it can stand in for PyPI offline.
+class IndexProxy():
+    def __init__(self, cache_dir, upstream=DEFAULT_UPSTREAM, max_bytes=20 * 1024**3):
+        self.cache_dir = cache_dir
+        self.upstream = upstream
+        self.local_upstream = os.path.isdir(upstream)
+        if not self.local_upstream and not self.upstream.endswith('/'):
+            self.upstream += '/'
+        self.max_bytes = max_bytes
+        self.server = None
+        self.pages = {}
+        self.lock = threading.Lock()
+        self.file_locks = {}
+        # artifacts are only fetched from the upstream host and the hosts its pages link to
+        self.file_hosts = set() if self.local_upstream else {get_origin(self.upstream)}
+        self.stats = {'page-hits': 0, 'page-misses': 0, 'hits': 0, 'misses': 0, 'bytes-served': 0, 'bytes-fetched': 0, 'evictions': 0}
+        os.makedirs(f'{cache_dir}/files', exist_ok=True)
+        self.total_size = sum(os.path.getsize(fname) for fname in glob.glob(f'{cache_dir}/files/*/*'))
+
+    def start(self, host='0.0.0.0', port=DEFAULT_PORT):
+        handler = type('Handler', (IndexProxyHandler,), {'proxy': self})
+        self.server = http.server.ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def print_stats(self):
+        stats = self.stats
+        requests = stats['hits'] + stats['misses']
+        hit_rate = 100 * stats['hits'] / requests if requests > 0 else 0
+        print(f"index proxy: {stats['hits']} hits, {stats['misses']} misses ({hit_rate:.0f}% hit rate), "
+              f"{stats['bytes-served'] / 1024**2:.1f} MB served, {stats['bytes-fetched'] / 1024**2:.1f} MB fetched, "
+              f"{stats['evictions']} evicted; project pages: {stats['page-hits']} hits, {stats['page-misses']} misses")
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def project_page(self, project):
+        project = canonical_name(project)
+        with self.lock:
+            cached = self.pages.get(project)
+        if cached is not None and time.time() - cached[0] < PAGE_TTL:
+            self.count('page-hits')
+            return cached[1]
+        self.count('page-misses')
+        if self.local_upstream:
+            links = self.local_links(project)
+        else:
+            links = self.upstream_links(project)
+        if links is None:
+            return None
+        html = [f'<!DOCTYPE html>\n<html><head><title>Links for {project}</title></head><body>']
+        html.append(f'<h1>Links for {project}</h1>')
+        html.extend(links)
+        html.append('</body></html>')
+        page = '\n'.join(html).encode('utf-8')
+        with self.lock:
+            self.pages[project] = (time.time(), page)
+        return page
+
+    def local_links(self, project):
+        links = []
+        for fname in sorted(os.listdir(self.upstream)):
+            if get_project_name(fname) != project:
+                continue
+            base = encode_base_url(f'file://{os.path.abspath(self.upstream)}')
+            links.append(f'<a href="/files/{base}/{html_escape(fname)}">{html_escape(fname)}</a><br/>')
+        return links if len(links) > 0 else None
+
+    def upstream_links(self, project):
+        url = f'{self.upstream}{project}/'
+        request = urllib.request.Request(url, headers={'Accept': 'text/html'})
+        try:
+            with urllib.request.urlopen(request, timeout=UPSTREAM_TIMEOUT) as r:
+                page_url = r.geturl()
+                page = r.read().decode('utf-8')
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+
+        def rewrite(mo):
+            url, fragment = urldefrag(urljoin(page_url, mo.group(1)))
+            base, fname = url.rsplit('/', 1)
+            with self.lock:
+                self.file_hosts.add(get_origin(base))
+            href = f'/files/{encode_base_url(base)}/{fname}'
+            if fragment:
+                href = f'{href}#{fragment}'
+            return f'href="{href}"'
+        return [re.sub(r'href="([^"]+)"', rewrite, line) for line in re.findall(r'<a [^>]*>[^<]*</a>', page)]
+
+    def cached_file(self, base, fname):
+        # returns the path of the cached artifact, fetching it from upstream on a miss,
+        # or None when the link does not point at the upstream index or its files host
+        base = decode_base_url(base)
+        source_path = None
+        if self.local_upstream:
+            # only the files directly in the local directory, read with open() once resolved
+            upstream_dir = os.path.realpath(self.upstream)
+            if base != f'file://{os.path.abspath(self.upstream)}':
+                return None
+            source_path = os.path.realpath(os.path.join(upstream_dir, unquote(fname)))
+            if os.path.dirname(source_path) != upstream_dir or os.path.basename(source_path).startswith('.') or not os.path.isfile(source_path):
+                return None
+            fname = os.path.basename(source_path)
+        elif not re.match(r'^https?://', base):
+            return None
+        else:
+            with self.lock:
+                if get_origin(base) not in self.file_hosts:
+                    return None
+        url = f'{base}/{fname}'
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        path = f'{self.cache_dir}/files/{key[:2]}/{key}'
+        with self.lock:
+            file_lock = self.file_locks.setdefault(key, threading.Lock())
+        with file_lock:
+            if os.path.exists(path):
+                os.utime(path)
+                self.count('hits')
+                return path
+            self.count('misses')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as dest_f:
+                    if source_path is not None:
+                        source = open(source_path, 'rb')
+                    else:
+                        source = urllib.request.urlopen(url, timeout=UPSTREAM_TIMEOUT)
+                    with source:
+                        shutil.copyfileobj(source, dest_f)
+                os.rename(tmp_path, path)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+        size = os.path.getsize(path)
+        self.count('bytes-fetched', size)
+        with self.lock:
+            self.total_size += size
+            if self.total_size > self.max_bytes:
+                self.evict()
+        return path
+
+    def evict(self):
+        entries = [(os.path.getmtime(fname), os.path.getsize(fname), fname) for fname in glob.glob(f'{self.cache_dir}/files/*/*')]
+        for mtime, size, fname in sorted(entries):
+            if self.total_size <= self.max_bytes:
+                break
+            os.unlink(fname)
+            self.total_size -= size
+            self.stats['evictions'] += 1
+
+
+class IndexProxyHandler(http.server.BaseHTTPRequestHandler):
+    proxy = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, content_type, body):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        try:
+            if mo := re.match(r'^/simple/([^/]+)/?$', self.path):
+                page = self.proxy.project_page(mo.group(1))
+                if page is None:
+                    self.send_error(404)
+                    return
+                self.send_body('text/html; charset=utf-8', page)
+            elif mo := re.match(r'^/files/([A-Za-z0-9_-]+)/([^/]+)$', self.path):
+                path = self.proxy.cached_file(mo.group(1), mo.group(2))
+                if path is None:
+                    self.send_error(404)
+                    return
+                size = os.path.getsize(path)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(size))
+                self.end_headers()
+                # counted first, so the stats include a file by the time its client has read it
+                self.proxy.count('bytes-served', size)
+                with open(path, 'rb') as f:
+                    shutil.copyfileobj(f, self.wfile)
+            else:
+                self.send_error(404)
+        except urllib.error.HTTPError as e:
+            self.send_error(e.code)
+        except (urllib.error.URLError, OSError) as e:
+            self.send_error(502, str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import gzip
+import time
+import shutil
+import hashlib
+import tempfile
+from collections import deque
+
+# Container output is stored once per distinct content, gzip compressed, under the sha256 of
+# the text: <store>/<first two hex digits>/<sha256>.txt.gz. Results only keep the hash, and
+# the report fetches and decompresses a log in the browser when it is opened.
+
+# a line longer than this is matched and retained in pieces
+MAX_LINE_BYTES = 64 * 1024
+
+
+def log_path(store_dir, log_hash):
+    return f'{store_dir}/{log_hash[:2]}/{log_hash}.txt.gz'
+
+
+def log_url(log_hash):
+    # relative to the report page, which is written next to the logs directory
+    return log_path('logs', log_hash)
+
+
+def store_log(store_dir, text):
+    data = text.encode('utf-8')
+    log_hash = hashlib.sha256(data).hexdigest()
+    path = log_path(store_dir, log_hash)
+    if os.path.exists(path):
+        # keep logs that are still produced from being pruned
+        os.utime(path)
+        return log_hash
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(gzip.compress(data, mtime=0))
+    os.chmod(tmp_path, 0o644)
+    os.rename(tmp_path, path)
+    return log_hash
+
+
+def read_log(store_dir, log_hash):
+    with gzip.open(log_path(store_dir, log_hash), 'rt', encoding='utf-8') as f:
+        return f.read()
+
+
+def copy_logs(store_dir, log_hashes, dest_dir):
+    copied = 0
+    for log_hash in log_hashes:
+        src = log_path(store_dir, log_hash)
+        dest = log_path(dest_dir, log_hash)
+        if not os.path.exists(src) or os.path.exists(dest):
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(src, dest)
+        copied += 1
+    return copied
+
+
+def prune_logs(store_dir, max_age_days):
+    # drops logs no run has produced for max_age_days
+    oldest = time.time() - max_age_days * 24 * 3600
+    removed = 0
+    for dirpath, dirnames, fnames in os.walk(store_dir):
+        for fname in fnames:
+            path = os.path.join(dirpath, fname)
+            if os.path.getmtime(path) < oldest:
+                os.unlink(path)
+                removed += 1
+    return removed
+
+
+def remove_unreferenced_logs(store_dir, log_hashes):
+    # drops every log of the store that is not in log_hashes
+    removed = 0
+    for dirpath, dirnames, fnames in os.walk(store_dir):
+        for fname in fnames:
+            if fname[:-len('.txt.gz')] not in log_hashes:
+                os.unlink(os.path.join(dirpath, fname))
+                removed += 1
+    return removed
+
+
+def get_log_hashes(test_results):
+    log_hashes = set()
+    for wheel, wheel_dict in test_results.items():
+        for test_name, result in wheel_dict.items():
+            for key in ['output-hash', 'full-output-hash']:
+                if key in result:
+                    log_hashes.add(result[key])
+    return log_hashes
+
+
+# Consumes container output as it arrives without ever holding all of it: every line is
+# matched against the classification patterns once, only the first head_bytes and the last
+# tail_bytes are retained for the result, and with a spill directory (the log store) the
+# complete output is gzipped straight into it.
+class LogCapture():
+    def __init__(self, patterns={}, head_bytes=64 * 1024, tail_bytes=256 * 1024, spill_dir=None):
+        self.patterns = {key: re.compile(pattern) for key, pattern in patterns.items()}
+        self.matched = set()
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = deque()
+        self.tail_size = 0
+        self.total_bytes = 0
+        self.partial = b''
+        self.spill_dir = spill_dir
+        self.spill = None
+        self.full_hash = None
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+            fd, self.spill_path = tempfile.mkstemp(dir=spill_dir)
+            self.spill = gzip.GzipFile(fileobj=os.fdopen(fd, 'wb'), mode='wb', mtime=0)
+            self.spill_sha256 = hashlib.sha256()
+
+    def feed(self, data):
+        self.total_bytes += len(data)
+        if self.spill is not None:
+            self.spill.write(data)
+            self.spill_sha256.update(data)
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        for line in lines:
+            self.add_line(line + b'\n')
+        while len(self.partial) > MAX_LINE_BYTES:
+            self.add_line(self.partial[:MAX_LINE_BYTES])
+            self.partial = self.partial[MAX_LINE_BYTES:]
+
+    def feed_file(self, f, chunk_size=64 * 1024):
+        while data := f.read(chunk_size):
+            self.feed(data)
+
+    def add_line(self, line):
+        if len(self.matched) < len(self.patterns):
+            text = line.decode('utf-8', errors='replace')
+            for key, pattern in self.patterns.items():
+                if key not in self.matched and pattern.search(text) is not None:
+                    self.matched.add(key)
+        if len(self.head) < self.head_bytes:
+            taken = line[:self.head_bytes - len(self.head)]
+            self.head += taken
+            line = line[len(taken):]
+            if len(line) == 0:
+                return
+        self.tail.append(line)
+        self.tail_size += len(line)
+        while self.tail_size > self.tail_bytes:
+            first = self.tail.popleft()
+            self.tail_size -= len(first)
+            keep = self.tail_bytes - self.tail_size
+            if keep > 0:
+                self.tail.appendleft(first[-keep:])
+                self.tail_size += keep
+
+    @property
+    def truncated_bytes(self):
+        return self.total_bytes - len(self.head) - self.tail_size - len(self.partial)
+
+    def close(self):
+        if len(self.partial) > 0:
+            self.add_line(self.partial)
+            self.partial = b''
+        if self.spill is None:
+            return
+        fileobj = self.spill.fileobj
+        self.spill.close()
+        fileobj.close()
+        self.spill = None
+        # the full copy is only worth keeping when the retained output is not already all of it
+        if self.truncated_bytes == 0:
+            os.unlink(self.spill_path)
+            return
+        self.full_hash = self.spill_sha256.hexdigest()
+        path = log_path(self.spill_dir, self.full_hash)
+        if os.path.exists(path):
+            os.unlink(self.spill_path)
+            os.utime(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(self.spill_path, 0o644)
+        os.rename(self.spill_path, path)
+
+    def text(self):
+        text = self.head.decode('utf-8', errors='replace')
+        if self.truncated_bytes > 0:
+            text += f'\n[... {self.truncated_bytes} bytes of output truncated ...]\n'
+        return text + b''.join(self.tail).decode('utf-8', errors='replace')
@@ -1,17 +1,34 @@
 #!/usr/bin/env python3
 
+import os
 import re
+import time
 import glob
 import json
 import lzma
-import math
+import pickle
+import resource
+import hashlib
 import argparse
 import requests
+import tempfile
+import importlib
+import concurrent.futures
 from functools import reduce
 from collections import OrderedDict, defaultdict
 from datetime import datetime, timedelta
 from html import escape as html_escape
 
+log_store = importlib.import_module("log-store")
+
+# the download ranks are cached in the cache directory (--cache-dir) under this name
+WHEEL_RANKS_CACHE = 'top-pypi-packages.json'
+WHEEL_RANKS_MAX_AGE = timedelta(days=7)
+# parsed copies of result files are kept in this directory of the cache directory (--cache-dir),
+# and removed once unused for RESULTS_CACHE_MAX_AGE
+RESULTS_CACHE_DIR = 'parsed-results'
+RESULTS_CACHE_MAX_AGE = timedelta(days=30)
+
 def main():
     parser = argparse.ArgumentParser(description="Parse result files and render an HTML page with a status summary")
     parser.add_argument('resultfiles', type=str, nargs='+', metavar='results.json', help='path to a result file')
@@ -19,15 +36,33 @@ def main():
     parser.add_argument('--by-test', action='store_true', help="print results by test (distro)")
     parser.add_argument('-o', '--output-file', type=str, help="file name to write report")
     parser.add_argument('--compare-weekday-num', type=int, help="integer weekday number to hinge the summary report on", default=None)
+    parser.add_argument('--history-db', type=str, help="history database of previous runs to use instead of previous result files", default=None)
+    parser.add_argument('--cache-dir', type=str, help="directory to keep the package ranks and parsed result files in between runs", default=None)
+    parser.add_argument('--format', type=str, choices=['html', 'data'], default='html',
+            help="with --by-test, 'data' writes the results as JSON next to the output file and a page that renders them")
 
     args = parser.parse_args()
-    if args.by_test:
-        html = print_table_by_distro_report(args.resultfiles, args.ignore, args.compare_weekday_num)
+    history_db = None
+    if args.history_db is not None:
+        history_db = importlib.import_module("results-db").ResultsDB(args.history_db)
+    if args.by_test and args.format == 'data':
+        if not args.output_file:
+            parser.error('--format data requires --output-file')
+        data_fname = f'{os.path.splitext(args.output_file)[0]}.json'
+        html, data = print_data_report(args.resultfiles, os.path.basename(data_fname), args.ignore, args.compare_weekday_num, history_db=history_db,
+                cache_dir=args.cache_dir)
+        with open(data_fname, 'w') as f:
+            f.write(data)
+    elif args.by_test:
+        html = print_table_by_distro_report(args.resultfiles, args.ignore, args.compare_weekday_num, history_db=history_db,
+                cache_dir=args.cache_dir)
     else:
-        html = print_table_report(args.resultfiles, args.ignore)
+        html = print_table_report(args.resultfiles, args.ignore, cache_dir=args.cache_dir)
     if args.output_file:
         with open(args.output_file, 'w') as f:
             f.write(html)
+        peak, workers_peak = get_peak_rss()
+        print(f"peak RSS: {peak:.0f} MB, {workers_peak:.0f} MB in the parser processes")
     else:
         print(html)
 
@@ -102,23 +137,108 @@ def get_wheel_report_cell(wheel, wheel_dict, ignore_tests):
     cell_text.append('</div>')
     return ('\n'.join(cell_text), badges)
 
-def load_result_files(test_results_fname_list):
-    for fname in test_results_fname_list:
-        if re.search(r'\.xz$', fname) is not None:
-            with lzma.open(fname) as f:
-                yield json.load(f), fname
-        else:
-            with open(fname) as f:
-                yield json.load(f), fname
-
-
-def print_table_report(test_results_fname_list, ignore_tests=[]):
+def read_result_file(fname, structured_only=False):
+    # with structured_only, the container output of older results files is dropped
+    if re.search(r'\.xz$', fname) is not None:
+        with lzma.open(fname) as f:
+            content = json.load(f)
+    else:
+        with open(fname) as f:
+            content = json.load(f)
+    if structured_only:
+        for wheel_dict in content.values():
+            for result in wheel_dict.values():
+                result.pop('output', None)
+    return content
+
+def get_sidecar_path(fname, cache_dir, structured_only=False):
+    # the parsed copy of a result file is keyed by its path, size and modification time,
+    # so a file that is replaced or rewritten is parsed again
+    path = os.path.abspath(fname)
+    st = os.stat(path)
+    key = hashlib.sha256(f'{path}\0{st.st_size}\0{st.st_mtime_ns}\0{structured_only}'.encode('utf-8')).hexdigest()
+    return f'{cache_dir}/{key}.pickle'
+
+def read_sidecar(fname, cache_dir, structured_only=False):
+    try:
+        sidecar = get_sidecar_path(fname, cache_dir, structured_only)
+        with open(sidecar, 'rb') as f:
+            content = pickle.load(f)
+        # the modification time of a sidecar is its last use, for the pruning
+        os.utime(sidecar)
+        return content
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return None
+
+def parse_result_file(fname, cache_dir, structured_only=False):
+    # runs in the worker processes of read_result_files: parses the file and stores the
+    # parsed copy next to the others
+    content = read_result_file(fname, structured_only)
+    if cache_dir is None:
+        return content
+    try:
+        sidecar = get_sidecar_path(fname, cache_dir, structured_only)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, sidecar)
+    except OSError:
+        pass
+    return content
+
+def prune_sidecars(cache_dir, max_age=RESULTS_CACHE_MAX_AGE):
+    oldest = time.time() - max_age.total_seconds()
+    for sidecar in glob.glob(f'{cache_dir}/*.pickle'):
+        try:
+            if os.path.getmtime(sidecar) < oldest:
+                os.unlink(sidecar)
+        except OSError:
+            pass
+
+def read_result_files(test_results_fname_list, cache_dir=None, structured_only=False):
+    # Returns the content of each file, in order. With a cache directory, files parsed before
+    # are read from their pickled copy in it; the others are decompressed and parsed in
+    # parallel, one worker process per file up to the number of cores. With structured_only
+    # the files are always parsed by the workers, so the output they drop never reaches this
+    # process.
+    sidecar_dir = f'{cache_dir}/{RESULTS_CACHE_DIR}' if cache_dir is not None else None
+    if sidecar_dir is not None:
+        contents = [read_sidecar(fname, sidecar_dir, structured_only) for fname in test_results_fname_list]
+    else:
+        contents = [None] * len(test_results_fname_list)
+    missing = [index for index, content in enumerate(contents) if content is None]
+    if len(missing) == 1 and not structured_only:
+        contents[missing[0]] = parse_result_file(test_results_fname_list[missing[0]], sidecar_dir)
+    elif len(missing) > 0:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(len(missing), os.cpu_count())) as executor:
+            fnames = [test_results_fname_list[index] for index in missing]
+            count = len(fnames)
+            for index, content in zip(missing, executor.map(parse_result_file, fnames, [sidecar_dir] * count, [structured_only] * count)):
+                contents[index] = content
+    if sidecar_dir is not None and len(missing) > 0:
+        prune_sidecars(sidecar_dir)
+    return contents
+
+def load_result_files(test_results_fname_list, structured_only=False, cache_dir=None):
+    contents = read_result_files(test_results_fname_list, cache_dir=cache_dir, structured_only=structured_only)
+    for content, fname in zip(contents, test_results_fname_list):
+        yield content, fname
+
+def get_peak_rss():
+    # in MB, of this process and of the worker processes that have finished
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / 1024, children_peak / 1024
+
+
+def print_table_report(test_results_fname_list, ignore_tests=[], cache_dir=None):
     test_results_list = []
     if ignore_tests is None:
         ignore_tests = []
 
     all_keys = set()
-    for test_results, fname in load_result_files(test_results_fname_list):
+    for test_results, fname in load_result_files(test_results_fname_list, cache_dir=cache_dir):
         test_results_list.append(test_results)
         all_keys.update(test_results.keys())
     all_keys = sorted(list(all_keys), key=str.lower)
@@ -193,11 +313,18 @@ def get_package_manager_name(test_name):
 
 
 class TestResultFile():
-    def __init__(self, fname):
+    def __init__(self, fname, structured_only=False):
         self.fname = fname
         self.content = None
         self.date = None
         self.wheels = {}
+        self.structured_only = structured_only
+
+    def get_output(self, wheel, test_name):
+        # the output of a file loaded with structured_only is read again from the file
+        if self.structured_only:
+            return read_result_file(self.fname)[wheel][test_name].get('output', '')
+        return self.content[wheel][test_name].get('output', '')
 
     def add_inferred_meta_data(self):
         for wheel, wheel_dict in self.content.items():
@@ -212,45 +339,129 @@ class TestResultFile():
             self.wheels[wheel]['passed-by-disribution'] = passed_by_distro
             self.wheels[wheel]['each-distribution-has-passing-option'] = len(list(filter(lambda x: not x, passed_by_distro.values()))) == 0
 
-def get_wheel_ranks():
-    url = 'https://hugovk.github.io/top-pypi-packages/top-pypi-packages-30-days.min.json'
-    try:
-        r = requests.get(url)
-    except requests.RequestsError:
-        print('failed to load top pypi packages list')
-        return []
+# Passing history of every (wheel, test-name) pair, built in a single pass over the runs from
+# oldest to newest; the each-distribution-has-passing-option flag of a wheel is tracked under
+# that name as its test-name. An entry is (date of the last pass, date of the first failure
+# since then, number of failing runs since then).
+class PassingIndex():
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, date, wheel, test_name, passed):
+        last_passed, first_failure, streak = self.entries.get((wheel, test_name), (None, None, 0))
+        if passed:
+            self.entries[(wheel, test_name)] = (date, None, 0)
+        else:
+            self.entries[(wheel, test_name)] = (last_passed, first_failure or date, streak + 1)
+
+    def add_test_result_file(self, test_result_file):
+        for wheel, wheel_info in test_result_file.wheels.items():
+            self.add(test_result_file.date, wheel, 'each-distribution-has-passing-option', wheel_info['each-distribution-has-passing-option'])
+            for test_name, result in wheel_info['results'].items():
+                self.add(test_result_file.date, wheel, test_name, result['test-passed'])
 
+    def get(self, wheel, test_name):
+        return self.entries.get((wheel, test_name), (None, None, 0))
+
+def canonical_name(name):
+    # PEP 503 normalization
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+def fetch_top_pypi_packages():
+    url = 'https://hugovk.github.io/top-pypi-packages/top-pypi-packages-30-days.min.json'
     try:
+        r = requests.get(url, timeout=30)
+        r.raise_for_status()
         packages = r.json()['rows']
         # the list should be sorted already, but lets not assume that
         packages = sorted(packages, key=lambda x: x['download_count'], reverse=True)
-        packages = [package['project'] for package in packages]
-        return packages
-    except KeyError:
+        return [package['project'] for package in packages]
+    except requests.RequestException:
+        print('failed to load top pypi packages list')
+        return None
+    except (KeyError, TypeError, ValueError):
         print('unable to parse top pypi packages list; the format may have changed')
-        return []
-
-def print_table_by_distro_report(test_results_fname_list, ignore_tests=[], compare_weekday_num=None):
-
-    test_results_list = []
-    for fname in test_results_fname_list:
-        test_result_file = TestResultFile(fname)
-        if re.search(r'\.xz$', fname) is not None:
-            with lzma.open(fname) as f:
-                test_result_file.content = json.load(f)
-        else:
-            with open(fname) as f:
-                test_result_file.content = json.load(f)
+        return None
 
-        mo = re.search('[^/]-([0-9\-_]+).json.xz', fname)
-        if mo is not None:
-            test_result_file.date = datetime.strptime(mo.group(1), "%Y-%m-%d_%H-%M-%S")
-        test_result_file.add_inferred_meta_data()
-        test_results_list.append(test_result_file)
+def read_wheel_ranks_cache(cache_file):
+    # a missing, truncated or corrupt copy is no copy
+    try:
+        with open(cache_file) as f:
+            packages = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(packages, list):
+        return None
+    return packages
+
+def get_wheel_ranks(cache_dir=None, max_age=WHEEL_RANKS_MAX_AGE):
+    # Maps the normalized name of a project to its rank by downloads. With a cache directory
+    # the list is cached in it and only downloaded again once it is older than max_age; when
+    # that download fails the cached copy is used no matter how old it is.
+    packages = None
+    cache_file = f'{cache_dir}/{WHEEL_RANKS_CACHE}' if cache_dir is not None else None
+    cached = cache_file is not None and os.path.exists(cache_file)
+    if cached and time.time() - os.path.getmtime(cache_file) < max_age.total_seconds():
+        packages = read_wheel_ranks_cache(cache_file)
+    if packages is None:
+        packages = fetch_top_pypi_packages()
+        if packages is not None and cache_file is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(f'{cache_file}.tmp', 'w') as f:
+                json.dump(packages, f)
+            os.replace(f'{cache_file}.tmp', cache_file)
+        elif packages is None and cached:
+            packages = read_wheel_ranks_cache(cache_file)
+            if packages is not None:
+                print(f'using the cached top pypi packages list from {cache_file}')
+        if packages is None:
+            packages = []
+    ranks = {}
+    for rank, package in enumerate(packages, start=1):
+        ranks.setdefault(canonical_name(package), rank)
+    return ranks
+
+def load_test_result_files(test_results_fname_list, structured_only=False, cache_dir=None):
+    contents = read_result_files(test_results_fname_list, cache_dir=cache_dir, structured_only=structured_only)
+    return [make_test_result_file(fname, content, structured_only) for fname, content in zip(test_results_fname_list, contents)]
+
+def load_test_result_file(fname, structured_only=False, cache_dir=None):
+    return load_test_result_files([fname], structured_only, cache_dir)[0]
+
+def get_result_file_date(fname):
+    mo = re.search('[^/]-([0-9\-_]+).json.xz', fname)
+    if mo is not None:
+        return datetime.strptime(mo.group(1), "%Y-%m-%d_%H-%M-%S")
+    return None
 
+def make_test_result_file(fname, content, structured_only=False):
+    test_result_file = TestResultFile(fname, structured_only)
+    test_result_file.content = content
+    test_result_file.date = get_result_file_date(fname)
+    test_result_file.add_inferred_meta_data()
+    return test_result_file
+
+def get_summary_row(test_result_file):
+    count = len(test_result_file.content)
+    failures = len(get_failing_tests(test_result_file.content))
+    all_passing = count - failures
+    date = test_result_file.date.strftime("%A, %B %d, %Y")
+    passing_options = len(list(filter(lambda wheel: wheel['each-distribution-has-passing-option'], test_result_file.wheels.values())))
+    return [date, count, all_passing, failures, passing_options]
+
+def load_report_results(test_results_fname_list, history_db=None, cache_dir=None):
+    # With a history_db (a results-db.ResultsDB holding the previous runs) only the newest
+    # file is loaded, and the history questions of the report are answered by the database.
+    # The report only shows the output of the newest file, so the older ones are loaded
+    # without it.
     # Sort the test result files by date because code that follows assumes this order.
-    test_results_list = sorted(test_results_list, key=lambda x: x.date, reverse=True)
+    test_results_fname_list = sorted(test_results_fname_list, key=get_result_file_date, reverse=True)
+    test_results_list = load_test_result_files(test_results_fname_list[:1], cache_dir=cache_dir)
+    if history_db is None:
+        test_results_list.extend(load_test_result_files(test_results_fname_list[1:], structured_only=True, cache_dir=cache_dir))
+    return test_results_list
 
+def get_report_names(test_results_list, ignore_tests=[]):
     # get a sorted list of all the wheel names
     wheel_name_set = set()
     # get a sorted list of all the test_names (distros, plus extra, e.g. centos-python38)
@@ -263,10 +474,99 @@ def print_table_by_distro_report(test_results_fname_list, ignore_tests=[], compa
                     all_test_names.add(test_name)
     wheel_name_set = sorted(list(wheel_name_set), key=str.lower)
     all_test_names = sorted(list(all_test_names))
+    return wheel_name_set, all_test_names
+
+def get_summary_table(test_results_list, compare_weekday_num=None, history_db=None):
+    # Find the result file to compare against for the top-level summary.
+    if type(compare_weekday_num) is not int:
+        return None
+    reference_test_file = None
+    reference_date = test_results_list[0].date
+    reference_date = reference_date.replace(hour=23, minute=59)
+    reference_date = reference_date - timedelta(days=reference_date.weekday()) + timedelta(days=compare_weekday_num)
+    current_weekday = test_results_list[0].date.weekday()
+    if current_weekday <= compare_weekday_num:
+        reference_date -= timedelta(days=7)
+    reference_row = None
+    if history_db is not None:
+        reference_run_date = history_db.latest_run_before(reference_date)
+        if reference_run_date is not None:
+            reference_row = history_db.summary_row(reference_run_date)
+    else:
+        for test_result_file in test_results_list:
+            if test_result_file.date < reference_date:
+                reference_test_file = test_result_file
+                break
+        if reference_test_file is not None:
+            reference_row = get_summary_row(reference_test_file)
+    summary_table = [['date', 'number of wheels', 'all tests passed', 'some tests failed', 'each dist has passing option']]
+    # without an older run to compare against, compare the current run with itself
+    summary_table.append(reference_row if reference_row is not None else get_summary_row(test_results_list[0]))
+    summary_table.append(get_summary_row(test_results_list[0]))
+    return summary_table
+
+def get_passing_index(test_results_list, history_db=None):
+    # the history is indexed once, oldest run first, ending with the current run
+    passing_index = PassingIndex()
+    if history_db is not None:
+        passing_index.entries.update(history_db.passing_history(test_results_list[0].date))
+    for test_result_file in reversed(test_results_list):
+        passing_index.add_test_result_file(test_result_file)
+    return passing_index
+
+def get_passing_notes(passing_index, wheel, test_name, date):
+    last_passing, first_failure, streak = passing_index.get(wheel, test_name)
+    notes = []
+    if last_passing:
+        notes.append(f'last passed on {last_passing.strftime("%B %d, %Y")}')
+    if first_failure and first_failure < date:
+        days = (date - first_failure).days
+        days = f'{days} day' if days == 1 else f'{days} days'
+        runs = f'{streak} run' if streak == 1 else f'{streak} runs'
+        notes.append(f'failing for {days} ({runs})')
+    return notes
+
+def get_result_badges(result):
+    # the (class, text) badges of a test result, and whether its output should be offered
+    badges = []
+    show_output = False
+    if result['test-passed']:
+        badges.append(('passed', 'passed'))
+    else:
+        badges.append(('failed', 'failed'))
+        show_output = True
+    if result["installed-version"]:
+        badges.append(('passed', f"installed version {result['installed-version']}"))
+    if result["installed-version"] and (result["installed-version"] != result["latest-version"]):
+        badges.append(('warning', f"latest version {result['latest-version']}"))
+    if result['build-required'] and result.get('wheel-cache-hit'):
+        badges.append(('warning', 'build required (cached)'))
+    elif result['build-required']:
+        badges.append(('warning', 'build required'))
+    if result['slow-install']:
+        badges.append(('warning', 'slow install'))
+    if result.get('reused'):
+        badges.append(('passed', 'reused previous result'))
+    if 'timeout' in result and result['timeout']:
+        badges.append(('failed', 'timed out'))
+        show_output = True
+    return badges, show_output
+
+def get_truncated_note(result):
+    if result.get('output-truncated-bytes', 0) == 0:
+        return None
+    truncated_kb = result['output-truncated-bytes'] / 1024
+    return f'{truncated_kb:.0f} KB of output truncated'
+
+def print_table_by_distro_report(test_results_fname_list, ignore_tests=[], compare_weekday_num=None, history_db=None, wheel_pages=False,
+        cache_dir=None):
+    # with wheel_pages, wheel names link to the history pages of wheel-pages.py
+    test_results_list = load_report_results(test_results_fname_list, history_db, cache_dir)
+    wheel_name_set, all_test_names = get_report_names(test_results_list, ignore_tests)
 
     # get the wheel popularity ranking
-    wheel_ranks = get_wheel_ranks()
-    leading_zeros = math.floor(math.log10(len(wheel_ranks))) + 1
+    wheel_ranks = get_wheel_ranks(cache_dir)
+    leading_zeros = len(str(len(wheel_ranks)))
     wheel_rank_format = f'{{n:0{leading_zeros}d}}'
 
     html = []
@@ -275,28 +575,8 @@ def print_table_by_distro_report(test_results_fname_list, ignore_tests=[], compa
     html.append(f'<h1>Python Wheels on aarch64 test results from {pretty_date}</h1>')
     html.append('<section class="summary">')
 
-    # Find the result file to compare against for the top-level summary.
-    reference_test_file = None
-    if type(compare_weekday_num) is int:
-        reference_date = test_results_list[0].date
-        reference_date = reference_date.replace(hour=23, minute=59)
-        reference_date = reference_date - timedelta(days=reference_date.weekday()) + timedelta(days=compare_weekday_num)
-        current_weekday = test_results_list[0].date.weekday()
-        if current_weekday <= compare_weekday_num:
-            reference_date -= timedelta(days=7)
-        for test_result_file in test_results_list:
-            if test_result_file.date < reference_date:
-                reference_test_file = test_result_file
-                break
-        summary_table = [['date', 'number of wheels', 'all tests passed', 'some tests failed', 'each dist has passing option']]
-        for test_result_file in [reference_test_file, test_results_list[0]]:
-            count = len(test_result_file.content)
-            failures = len(get_failing_tests(test_result_file.content))
-            all_passing = count - failures
-            date = test_result_file.date.strftime("%A, %B %d, %Y")
-            passing_options = len(list(filter(lambda wheel: wheel['each-distribution-has-passing-option'], test_result_file.wheels.values())))
-            summary_table.append([date, count, all_passing, failures, passing_options])
-
+    summary_table = get_summary_table(test_results_list, compare_weekday_num, history_db)
+    if summary_table is not None:
         html.append('<table class="summary">')
         for index in range(len(summary_table[0])):
             html.append('<tr>')
@@ -327,24 +607,11 @@ def print_table_by_distro_report(test_results_fname_list, ignore_tests=[], compa
         html.append(f'<th class="test-column {get_package_name_class(test_name)}">{test_name}</th>')
     html.append('</thead></tr><tbody>')
 
+    passing_index = get_passing_index(test_results_list, history_db)
+
     def date_of_last_passing_html(wheel, test_name):
-        if test_name == 'each-distribution-has-passing-option':
-            passing_lambda = lambda tf: tf.wheels[wheel][test_name]
-        else:
-            passing_lambda = lambda tf: tf.content[wheel][test_name]['test-passed']
-        last_passing = None
-        for test_result_file in test_results_list[1:]:
-            try:
-                if passing_lambda(test_result_file):
-                    last_passing = test_result_file.date
-                    break
-            except KeyError:
-                continue
-        if last_passing:
-            last_passing = last_passing.strftime("%B %d, %Y")
-            return f'<br /><span class="file-indicator">last passed on {last_passing}</span>'
-        else:
-            return ''
+        notes = get_passing_notes(passing_index, wheel, test_name, test_results_list[0].date)
+        return ''.join(f'<br /><span class="file-indicator">{note}</span>' for note in notes)
 
     test_result_file = test_results_list[0]
     # Iterate over the sorted list of wheel names
@@ -358,11 +625,10 @@ def print_table_by_distro_report(test_results_fname_list, ignore_tests=[], compa
         else:
             file_indicator = ''
         html.append(f'<tr class="wheel-line {odd_even}">')
-        html.append(f'<td class="wheel-name {different_class}">{wheel}{file_indicator}</td>')
-        try:
-            wheel_rank = wheel_rank_format.format(n=wheel_ranks.index(wheel) + 1)
-        except (IndexError, ValueError):
-            wheel_rank = '~'
+        wheel_html = f'<a href="wheels/{canonical_name(wheel)}.html">{wheel}</a>' if wheel_pages else wheel
+        html.append(f'<td class="wheel-name {different_class}">{wheel_html}{file_indicator}</td>')
+        wheel_rank = wheel_ranks.get(canonical_name(wheel))
+        wheel_rank = wheel_rank_format.format(n=wheel_rank) if wheel_rank is not None else '~'
         html.append(f'<td class="">{wheel_rank}</td>')
         html.append('<td class="">')
         if wheel in test_result_file.wheels:
@@ -377,31 +643,30 @@ def print_table_by_distro_report(test_results_fname_list, ignore_tests=[], compa
             html.append(f'<td class="test-column {get_package_name_class(test_name)}">')
             if wheel in test_result_file.content and test_name in test_result_file.content[wheel]:
                 result = test_result_file.content[wheel][test_name]
-                show_output = False
-                if result['test-passed']:
-                    html.append(make_badge(classes=['passed'], text='passed'))
-                else:
-                    html.append(make_badge(classes=['failed'], text='failed'))
-                    show_output = True
-                if result["installed-version"]:
-                    html.append(make_badge(classes=['passed'], text=f"installed version {result['installed-version']}"))
-                if result["installed-version"] and (result["installed-version"] != result["latest-version"]):
-                    html.append(make_badge(classes=['warning'], text=f"latest version {result['latest-version']}"))
-                if result['build-required']:
-                    html.append(make_badge(classes=['warning'], text='build required'))
-                if result['slow-install']:
-                    html.append(make_badge(classes=['warning'], text='slow install'))
-                if 'timeout' in result and result['timeout']:
-                    html.append(make_badge(classes=['failed'], text='timed out'))
-                    show_output = True
+                badges, show_output = get_result_badges(result)
+                for badge_class, text in badges:
+                    html.append(make_badge(classes=[badge_class], text=text))
 
                 if show_output:
                     html.append(date_of_last_passing_html(wheel, test_name))
                     output_id = html_escape(f"output_{test_result_file.date}_{wheel}_{test_name}")
-                    output_html = html_escape(result['output'])
-                    html.append(f'<input type="checkbox" id="{output_id}" class="output-toggle" />')
-                    html.append(f'<label for="{output_id}" class="output-toggle">Toggle Output</label>')
-                    html.append(f'<pre class="output-content">{output_html}</pre>')
+                    if 'output-hash' in result:
+                        # the log is fetched from the log store when the output is first shown
+                        log_url = html_escape(log_store.log_url(result['output-hash']))
+                        if note := get_truncated_note(result):
+                            if 'full-output-hash' in result:
+                                full_log_url = html_escape(log_store.log_url(result['full-output-hash']))
+                                note = f'{note}, <a href="{full_log_url}">full output (gzip)</a>'
+                            html.append(f'<br /><span class="file-indicator">{note}</span><br />')
+                        # the input, label and pre have to stay adjacent for the toggle styles
+                        html.append(f'<input type="checkbox" id="{output_id}" class="output-toggle" data-log="{log_url}" />')
+                        html.append(f'<label for="{output_id}" class="output-toggle">Toggle Output</label>')
+                        html.append('<pre class="output-content"></pre>')
+                    else:
+                        output_html = html_escape(test_result_file.get_output(wheel, test_name))
+                        html.append(f'<input type="checkbox" id="{output_id}" class="output-toggle" />')
+                        html.append(f'<label for="{output_id}" class="output-toggle">Toggle Output</label>')
+                        html.append(f'<pre class="output-content">{output_html}</pre>')
 
             html.append('</td>')
 
@@ -413,6 +678,73 @@ def print_table_by_distro_report(test_results_fname_list, ignore_tests=[], compa
     html = '\n'.join(html)
     return html
 
+def get_report_data(test_results_fname_list, ignore_tests=[], compare_weekday_num=None, history_db=None, wheel_pages=False,
+        cache_dir=None):
+    # The matrix of print_table_by_distro_report as compact JSON for the DATA_REPORT_HTML
+    # renderer. Badges are dictionary encoded: 'badges' lists every distinct (class, text)
+    # pair once and cells refer to them by index. Every wheel is a row
+    #   [name, rank or null, each-distribution badge or null, notes, cells]
+    # with one cell per entry of 'tests', null when the wheel was not tested there, else
+    #   [passed, badges, notes, log url or null, inline output or null]
+    test_results_list = load_report_results(test_results_fname_list, history_db, cache_dir)
+    wheel_name_set, all_test_names = get_report_names(test_results_list, ignore_tests)
+    wheel_ranks = get_wheel_ranks(cache_dir)
+    passing_index = get_passing_index(test_results_list, history_db)
+    test_result_file = test_results_list[0]
+    date = test_result_file.date
+
+    badge_ids = {}
+    def badge_id(badge):
+        return badge_ids.setdefault(badge, len(badge_ids))
+
+    rows = []
+    for wheel in wheel_name_set:
+        distro_badge = None
+        distro_notes = []
+        if wheel in test_result_file.wheels:
+            if test_result_file.wheels[wheel]['each-distribution-has-passing-option']:
+                distro_badge = badge_id(('passed', 'yes'))
+            else:
+                distro_badge = badge_id(('failed', 'no'))
+                distro_notes = get_passing_notes(passing_index, wheel, 'each-distribution-has-passing-option', date)
+        cells = []
+        for test_name in all_test_names:
+            result = test_result_file.content.get(wheel, {}).get(test_name)
+            if result is None:
+                cells.append(None)
+                continue
+            badges, show_output = get_result_badges(result)
+            notes = []
+            log_url = None
+            inline_output = None
+            if show_output:
+                notes = get_passing_notes(passing_index, wheel, test_name, date)
+                if 'output-hash' in result:
+                    log_url = log_store.log_url(result['output-hash'])
+                    if note := get_truncated_note(result):
+                        notes.append(note)
+                else:
+                    inline_output = test_result_file.get_output(wheel, test_name)
+            cells.append([int(result['test-passed']), [badge_id(badge) for badge in badges], notes, log_url, inline_output])
+        rows.append([wheel, wheel_ranks.get(canonical_name(wheel)), distro_badge, distro_notes, cells])
+
+    return {
+        'date': date.strftime("%B %d, %Y"),
+        'summary': get_summary_table(test_results_list, compare_weekday_num, history_db),
+        'tests': all_test_names,
+        'test-classes': [get_package_name_class(test_name) for test_name in all_test_names],
+        'badges': [list(badge) for badge in badge_ids],
+        'wheels': rows,
+        'wheel-pages': wheel_pages,
+    }
+
+def print_data_report(test_results_fname_list, data_url, ignore_tests=[], compare_weekday_num=None, history_db=None, wheel_pages=False,
+        cache_dir=None):
+    # returns the renderer page, which loads the data from data_url, and the JSON data for it
+    data = get_report_data(test_results_fname_list, ignore_tests, compare_weekday_num, history_db, wheel_pages, cache_dir)
+    html = DATA_REPORT_HTML.replace('{data_url}', html_escape(data_url))
+    return html, json.dumps(data, separators=(',', ':'))
+
 HTML_HEADER = '''
 <!doctype html>
 <html>
@@ -425,6 +757,26 @@ HTML_HEADER = '''
             $('#python-wheel-report').DataTable({
                 paginate: false
             });
+            // logs are gzip files in the log store, loaded the first time their output is shown
+            $(document).on('change', 'input.output-toggle[data-log]', function() {
+                var pre = $(this).nextAll('pre.output-content')[0];
+                if (!this.checked || pre.dataset.loaded) {
+                    return;
+                }
+                pre.dataset.loaded = 'true';
+                pre.textContent = 'loading...';
+                fetch(this.dataset.log).then(function(response) {
+                    if (!response.ok) {
+                        throw new Error(response.status + ' ' + response.statusText);
+                    }
+                    return new Response(response.body.pipeThrough(new DecompressionStream('gzip'))).text();
+                }).then(function(text) {
+                    pre.textContent = text;
+                }, function(error) {
+                    pre.textContent = 'failed to load the output: ' + error;
+                    delete pre.dataset.loaded;
+                });
+            });
         });
 </script>
 <style type="text/css">
@@ -553,5 +905,344 @@ HTML_FOOTER = '''
 </html>
 '''
 
+# Renderer for the data of get_report_data: only the rows in view are in the DOM, and the
+# wheels are sorted (click a column header) and filtered in the browser.
+DATA_REPORT_HTML = '''
+<!doctype html>
+<html>
+<head>
+<meta charset="utf-8" />
+<style type="text/css">
+body {
+    margin: 0 1em;
+    font-family: sans-serif;
+}
+h1 {
+    text-align: center;
+}
+table.summary {
+    margin: 0 auto;
+    width: 700px;
+    border-collapse: collapse;
+}
+table.summary th, table.summary td {
+    border: solid 1px;
+    padding: 3px;
+}
+div.controls {
+    margin: 1em 0;
+}
+div.viewport {
+    height: calc(100vh - 4em);
+    overflow: auto;
+    font-family: monospace;
+}
+div.report-row {
+    display: grid;
+    line-height: 1.6em;
+}
+div.report-row > div {
+    padding: 5px;
+    overflow-y: auto;
+}
+div.report-header {
+    position: sticky;
+    top: 0;
+    z-index: 1;
+    background-color: white;
+    font-weight: bold;
+    cursor: pointer;
+}
+div.report-body {
+    position: relative;
+}
+div.report-rows {
+    position: absolute;
+    left: 0;
+    right: 0;
+}
+div.report-row.odd {
+    background-color: #f1f1f1;
+}
+span.badge {
+    border-radius: 4px;
+    margin: 3px;
+    padding: 2px;
+    white-space: nowrap;
+    color: white;
+}
+span.passed {
+    background: #8eb92a;
+}
+span.failed {
+    background: #f16f5c;
+}
+span.warning {
+    background: #febf04;
+}
+span.file-indicator {
+    display: block;
+    font-size: 0.7em;
+}
+a.output-toggle {
+    cursor: pointer;
+    text-decoration: underline;
+}
+div.output-panel {
+    display: none;
+    position: fixed;
+    left: 5%;
+    right: 5%;
+    top: 5%;
+    bottom: 5%;
+    z-index: 2;
+    background-color: white;
+    border: solid 1px;
+    box-shadow: 0 0 1em #888;
+}
+div.output-panel.open {
+    display: flex;
+    flex-direction: column;
+}
+div.output-panel pre {
+    flex: 1;
+    margin: 0;
+    padding: 1em;
+    overflow: auto;
+}
+</style>
+</head>
+<body data-report="{data_url}">
+<h1 id="title">Python Wheels on aarch64 test results</h1>
+<section id="summary"></section>
+<div class="controls">
+<input type="search" id="filter" placeholder="filter wheels" />
+<label><input type="checkbox" id="only-failing" /> only wheels with failing tests</label>
+<span id="count"></span>
+</div>
+<div class="viewport" id="viewport">
+<div class="report-row report-header" id="header"></div>
+<div class="report-body" id="body"><div class="report-rows" id="rows"></div></div>
+</div>
+<div class="output-panel" id="output-panel">
+<div><a class="output-toggle" id="output-close">close</a> <span id="output-title"></span></div>
+<pre id="output"></pre>
+</div>
+<script type="text/javascript">
+(function() {
+    var ROW_HEIGHT = 120;
+    var OVERSCAN = 10;
+    var data = null;
+    var rows = [];
+    var sortColumn = 0;
+    var sortDescending = false;
+
+    function element(tag, className, text) {
+        var e = document.createElement(tag);
+        if (className) {
+            e.className = className;
+        }
+        if (text !== undefined) {
+            e.textContent = text;
+        }
+        return e;
+    }
+
+    function appendBadge(parent, badgeId) {
+        var badge = data.badges[badgeId];
+        parent.appendChild(element('span', 'badge ' + badge[0], badge[1]));
+    }
+
+    function appendNotes(parent, notes) {
+        notes.forEach(function(note) {
+            parent.appendChild(element('span', 'file-indicator', note));
+        });
+    }
+
+    function showOutput(title, logUrl, inlineOutput) {
+        var pre = document.getElementById('output');
+        document.getElementById('output-title').textContent = title;
+        document.getElementById('output-panel').className = 'output-panel open';
+        if (!logUrl) {
+            pre.textContent = inlineOutput;
+            return;
+        }
+        // logs are gzip files in the log store
+        pre.textContent = 'loading...';
+        fetch(logUrl).then(function(response) {
+            if (!response.ok) {
+                throw new Error(response.status + ' ' + response.statusText);
+            }
+            return new Response(response.body.pipeThrough(new DecompressionStream('gzip'))).text();
+        }).then(function(text) {
+            pre.textContent = text;
+        }, function(error) {
+            pre.textContent = 'failed to load the output: ' + error;
+        });
+    }
+
+    function renderRow(row, index) {
+        var div = element('div', 'report-row ' + (index % 2 ? 'even' : 'odd'));
+        div.style.gridTemplateColumns = columnTemplate();
+        div.style.height = ROW_HEIGHT + 'px';
+        var name = element('div', 'wheel-name');
+        if (data['wheel-pages']) {
+            var link = element('a', '', row[0]);
+            link.href = 'wheels/' + row[0].replace(/[-_.]+/g, '-').toLowerCase() + '.html';
+            name.appendChild(link);
+        } else {
+            name.textContent = row[0];
+        }
+        div.appendChild(name);
+        div.appendChild(element('div', '', row[1] === null ? '~' : String(row[1])));
+        var distro = element('div');
+        if (row[2] !== null) {
+            appendBadge(distro, row[2]);
+        }
+        appendNotes(distro, row[3]);
+        div.appendChild(distro);
+        row[4].forEach(function(cell, testIndex) {
+            var td = element('div', 'test-column ' + data['test-classes'][testIndex]);
+            if (cell !== null) {
+                cell[1].forEach(function(badgeId) {
+                    appendBadge(td, badgeId);
+                });
+                appendNotes(td, cell[2]);
+                if (cell[3] !== null || cell[4] !== null) {
+                    var link = element('a', 'output-toggle', 'Show Output');
+                    link.addEventListener('click', function() {
+                        showOutput(row[0] + ' on ' + data.tests[testIndex], cell[3], cell[4]);
+                    });
+                    td.appendChild(link);
+                }
+            }
+            div.appendChild(td);
+        });
+        return div;
+    }
+
+    function render() {
+        var viewport = document.getElementById('viewport');
+        var header = document.getElementById('header');
+        var scrollTop = Math.max(0, viewport.scrollTop - header.offsetHeight);
+        var first = Math.max(0, Math.floor(scrollTop / ROW_HEIGHT) - OVERSCAN);
+        var last = Math.min(rows.length, Math.ceil((scrollTop + viewport.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+        var container = document.getElementById('rows');
+        container.style.top = (first * ROW_HEIGHT) + 'px';
+        var fragment = document.createDocumentFragment();
+        for (var index = first; index < last; index++) {
+            fragment.appendChild(renderRow(rows[index], index));
+        }
+        container.replaceChildren(fragment);
+    }
+
+    function columnTemplate() {
+        return '16em 6em 8em repeat(' + data.tests.length + ', minmax(12em, 1fr))';
+    }
+
+    function sortKey(row) {
+        if (sortColumn === 0) {
+            return row[0].toLowerCase();
+        } else if (sortColumn === 1) {
+            return row[1] === null ? Infinity : row[1];
+        } else if (sortColumn === 2) {
+            return row[2] === null ? -1 : data.badges[row[2]][0] === 'passed' ? 1 : 0;
+        }
+        var cell = row[4][sortColumn - 3];
+        return cell === null ? -1 : cell[0];
+    }
+
+    function update() {
+        var filter = document.getElementById('filter').value.toLowerCase();
+        var onlyFailing = document.getElementById('only-failing').checked;
+        rows = data.wheels.filter(function(row) {
+            if (filter && row[0].toLowerCase().indexOf(filter) < 0) {
+                return false;
+            }
+            return !onlyFailing || row[4].some(function(cell) {
+                return cell !== null && !cell[0];
+            });
+        });
+        var keys = new Map(rows.map(function(row) {
+            return [row, sortKey(row)];
+        }));
+        rows.sort(function(a, b) {
+            var ka = keys.get(a), kb = keys.get(b);
+            var order = ka < kb ? -1 : ka > kb ? 1 : 0;
+            return sortDescending ? -order : order;
+        });
+        document.getElementById('count').textContent = rows.length + ' of ' + data.wheels.length + ' wheels';
+        document.getElementById('body').style.height = (rows.length * ROW_HEIGHT) + 'px';
+        render();
+    }
+
+    function renderHeader() {
+        var header = document.getElementById('header');
+        header.style.gridTemplateColumns = columnTemplate();
+        var titles = ['', 'rank by downloads on pypi', 'at least one passing option per distribution?'].concat(data.tests);
+        titles.forEach(function(title, column) {
+            var th = element('div', column >= 3 ? 'test-column ' + data['test-classes'][column - 3] : '', title);
+            th.addEventListener('click', function() {
+                sortDescending = sortColumn === column ? !sortDescending : false;
+                sortColumn = column;
+                update();
+            });
+            header.appendChild(th);
+        });
+    }
+
+    function renderSummary() {
+        var summary = data.summary;
+        if (summary === null) {
+            return;
+        }
+        var table = element('table', 'summary');
+        summary[0].forEach(function(name, index) {
+            var tr = element('tr');
+            summary.forEach(function(column, columnIndex) {
+                tr.appendChild(element(columnIndex === 0 ? 'th' : 'td', '', String(column[index])));
+            });
+            var difference = '';
+            if (name !== 'date') {
+                difference = summary[2][index] - summary[1][index];
+                difference = (difference >= 0 ? '+' : '') + difference;
+            }
+            tr.appendChild(element('td', '', difference));
+            table.appendChild(tr);
+        });
+        document.getElementById('summary').appendChild(table);
+    }
+
+    fetch(document.body.dataset.report).then(function(response) {
+        return response.json();
+    }).then(function(reportData) {
+        data = reportData;
+        document.getElementById('title').textContent = 'Python Wheels on aarch64 test results from ' + data.date;
+        renderSummary();
+        renderHeader();
+        var scheduled = false;
+        document.getElementById('viewport').addEventListener('scroll', function() {
+            if (!scheduled) {
+                scheduled = true;
+                window.requestAnimationFrame(function() {
+                    scheduled = false;
+                    render();
+                });
+            }
+        });
+        window.addEventListener('resize', render);
+        document.getElementById('filter').addEventListener('input', update);
+        document.getElementById('only-failing').addEventListener('change', update);
+        document.getElementById('output-close').addEventListener('click', function() {
+            document.getElementById('output-panel').className = 'output-panel';
+        });
+        update();
+    });
+})();
+</script>
+</body>
+</html>
+'''
+
 if __name__ == '__main__':
     main()
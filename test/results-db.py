@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import argparse
+import sqlite3
+import itertools
+import importlib
+from datetime import datetime
+from collections import defaultdict
+
+process_results = importlib.import_module("process-results")
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# the keys of the result fields stored in the results table, in column order
+RESULT_FIELDS = ['test-passed', 'build-required', 'binary-wheel', 'slow-install', 'timeout', 'runtime', 'latest-version', 'installed-version']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    date TEXT PRIMARY KEY,
+    fname TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    date TEXT NOT NULL,
+    wheel TEXT NOT NULL,
+    test_name TEXT NOT NULL,
+    test_passed INTEGER NOT NULL,
+    build_required INTEGER,
+    binary_wheel INTEGER,
+    slow_install INTEGER,
+    timeout INTEGER,
+    runtime REAL,
+    latest_version TEXT,
+    installed_version TEXT,
+    PRIMARY KEY (date, wheel, test_name)
+);
+CREATE INDEX IF NOT EXISTS results_by_test ON results (wheel, test_name, date);
+CREATE TABLE IF NOT EXISTS wheels (
+    date TEXT NOT NULL,
+    wheel TEXT NOT NULL,
+    each_distribution_has_passing_option INTEGER NOT NULL,
+    PRIMARY KEY (date, wheel)
+);
+CREATE INDEX IF NOT EXISTS wheels_by_wheel ON wheels (wheel, date);
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the SQLite history of nightly test results")
+    parser.add_argument('--db', type=str, help="path to the history database", required=True)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="import result files into the database")
+    import_parser.add_argument('resultfiles', type=str, nargs='+', metavar='results.json', help='path to a result file')
+    import_parser.add_argument('--force', action='store_true', help="re-import runs that are already in the database")
+    args = parser.parse_args()
+
+    db = ResultsDB(args.db)
+    if args.command == 'import':
+        for fname in args.resultfiles:
+            if db.import_results_file(fname, force=args.force):
+                print(f"imported {fname}")
+            else:
+                print(f"{fname} is already in the database")
+    db.close()
+
+
+# Structured results of every nightly run (everything but the container output), keyed by
+# (date, wheel, test-name) and indexed by (wheel, test-name, date) for the history queries
+# of the report.
+class ResultsDB():
+    def __init__(self, fname):
+        self.conn = sqlite3.connect(fname)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM runs').fetchone()[0]
+
+    def import_results_file(self, fname, force=False):
+        test_result_file = process_results.load_test_result_file(fname)
+        date = test_result_file.date.strftime(DATE_FORMAT)
+        if not force and self.conn.execute('SELECT 1 FROM runs WHERE date = ?', (date,)).fetchone() is not None:
+            return False
+        self.import_test_result_file(test_result_file)
+        return True
+
+    def import_test_result_file(self, test_result_file):
+        date = test_result_file.date.strftime(DATE_FORMAT)
+        results = []
+        wheels = []
+        for wheel, wheel_info in test_result_file.wheels.items():
+            wheels.append((date, wheel, wheel_info['each-distribution-has-passing-option']))
+            for test_name, result in wheel_info['results'].items():
+                results.append((date, wheel, test_name, result['test-passed'], result['build-required'],
+                    result['binary-wheel'], result['slow-install'], result.get('timeout', False), result.get('runtime'),
+                    result.get('latest-version'), result.get('installed-version')))
+        with self.conn:
+            self.conn.execute('DELETE FROM results WHERE date = ?', (date,))
+            self.conn.execute('DELETE FROM wheels WHERE date = ?', (date,))
+            self.conn.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', results)
+            self.conn.executemany('INSERT INTO wheels VALUES (?, ?, ?)', wheels)
+            self.conn.execute('INSERT OR REPLACE INTO runs VALUES (?, ?)', (date, test_result_file.fname))
+
+    def latest_run_before(self, date):
+        row = self.conn.execute('SELECT MAX(date) FROM runs WHERE date < ?', (date.strftime(DATE_FORMAT),)).fetchone()
+        return datetime.strptime(row[0], DATE_FORMAT) if row[0] is not None else None
+
+    def passing_history(self, before):
+        # the entries of a process_results.PassingIndex built from every run before the given date:
+        # ((wheel, test-name), (last pass, first failure since, failing runs since)) pairs
+        results_query = '''WITH last_passed AS (SELECT wheel, test_name, MAX(date) AS date FROM results
+                WHERE test_passed AND date < :before GROUP BY wheel, test_name)
+            SELECT r.wheel, r.test_name, lp.date,
+                MIN(CASE WHEN NOT r.test_passed AND (lp.date IS NULL OR r.date > lp.date) THEN r.date END),
+                COUNT(CASE WHEN NOT r.test_passed AND (lp.date IS NULL OR r.date > lp.date) THEN 1 END)
+            FROM results AS r LEFT JOIN last_passed AS lp USING (wheel, test_name)
+            WHERE r.date < :before GROUP BY r.wheel, r.test_name'''
+        wheels_query = '''WITH last_passed AS (SELECT wheel, MAX(date) AS date FROM wheels
+                WHERE each_distribution_has_passing_option AND date < :before GROUP BY wheel)
+            SELECT w.wheel, 'each-distribution-has-passing-option', lp.date,
+                MIN(CASE WHEN NOT w.each_distribution_has_passing_option AND (lp.date IS NULL OR w.date > lp.date) THEN w.date END),
+                COUNT(CASE WHEN NOT w.each_distribution_has_passing_option AND (lp.date IS NULL OR w.date > lp.date) THEN 1 END)
+            FROM wheels AS w LEFT JOIN last_passed AS lp USING (wheel)
+            WHERE w.date < :before GROUP BY w.wheel'''
+        params = {'before': before.strftime(DATE_FORMAT)}
+        parse_date = lambda text: datetime.strptime(text, DATE_FORMAT) if text is not None else None
+        for query in [results_query, wheels_query]:
+            for wheel, test_name, last_passed, first_failure, streak in self.conn.execute(query, params):
+                yield (wheel, test_name), (parse_date(last_passed), parse_date(first_failure), streak)
+
+    def iter_runs(self):
+        # (date, {wheel: {test-name: result}}) for every run, oldest first; the results only
+        # have the fields kept in the database
+        query = '''SELECT date, wheel, test_name, test_passed, build_required, binary_wheel, slow_install, timeout,
+            runtime, latest_version, installed_version FROM results ORDER BY date'''
+        for date, rows in itertools.groupby(self.conn.execute(query), key=lambda row: row[0]):
+            wheel_results = defaultdict(dict)
+            for _, wheel, test_name, *values in rows:
+                wheel_results[wheel][test_name] = dict(zip(RESULT_FIELDS, values))
+            yield datetime.strptime(date, DATE_FORMAT), wheel_results
+
+    def summary_row(self, date):
+        # same columns as process_results.get_summary_row
+        date_text = date.strftime(DATE_FORMAT)
+        count, failures = self.conn.execute('''SELECT COUNT(*), COALESCE(SUM(failing), 0) FROM
+            (SELECT MIN(test_passed) = 0 AS failing FROM results WHERE date = ? GROUP BY wheel)''', (date_text,)).fetchone()
+        passing_options = self.conn.execute('''SELECT COUNT(*) FROM wheels
+            WHERE date = ? AND each_distribution_has_passing_option''', (date_text,)).fetchone()[0]
+        return [date.strftime("%A, %B %d, %Y"), count, count - failures, failures, passing_options]
+
+
+if __name__ == '__main__':
+    main()
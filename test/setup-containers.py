@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+# Runs on the host before the tests, so it only uses the standard library.
+
+import os
+import re
+import json
+import time
+import hashlib
+import argparse
+import importlib
+import subprocess
+import concurrent.futures
+from datetime import datetime, timezone
+
+docker_api = importlib.import_module("docker-api")
+
+IMAGES = ['focal', 'jammy', 'noble', 'amazon-linux2', 'amazon-linux2-py38', 'amazon-linux2023', 'testhost']
+# label holding the hash of everything an image was built from
+BUILD_KEY_LABEL = 'wheel-tester.build-key'
+# images are rebuilt at least this often, to pick up the package updates of their base
+MAX_IMAGE_AGE = 7
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pull the base images and build the wheel-tester images that are out of date")
+    parser.add_argument('images', type=str, nargs='*', help='images to build, all of them by default')
+    parser.add_argument('--jobs', type=int, default=4, help='number of images pulled or built at once')
+    parser.add_argument('--force', action='store_true', help='build every image, even those that are up to date')
+    parser.add_argument('--max-age', type=float, default=MAX_IMAGE_AGE, help='days after which an up to date image is rebuilt anyway')
+    parser.add_argument('--times-file', type=str, default='results/image-builds.json', help='file to record the build time of each image in')
+    args = parser.parse_args()
+
+    # change working directory the path of this script
+    os.chdir(os.path.dirname(os.path.realpath(__file__)))
+    images = args.images if len(args.images) > 0 else IMAGES
+    docker_client = docker_api.DockerClient()
+
+    start = time.time()
+    base_images = {image: get_base_image(image) for image in images}
+    # fetch the latest version of each base image, without this step the build phase
+    # would use cached (old) versions of the base containers
+    external_bases = sorted(set(base for base in base_images.values() if not base.startswith('wheel-tester/')))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        list(executor.map(pull_image, external_bases))
+    print(f"pulled {len(external_bases)} base images in {time.time() - start:.0f}s")
+
+    # images built FROM another wheel-tester image wait for it
+    futures = {}
+    records = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        def build(image):
+            base = base_images[image]
+            if base in futures:
+                futures[base].result()
+            return build_image(docker_client, image, base, force=args.force, max_age=args.max_age * 24 * 3600)
+        for image in sort_by_dependencies(images, base_images):
+            futures[f'wheel-tester/{image}'] = executor.submit(build, image)
+        failed = []
+        for image in images:
+            try:
+                records[image] = futures[f'wheel-tester/{image}'].result()
+            except subprocess.CalledProcessError:
+                failed.append(image)
+    docker_client.close()
+
+    for image, record in records.items():
+        outcome = f"built in {record['build-time']:.0f}s" if record['built'] else "up to date"
+        print(f"wheel-tester/{image}: {outcome}")
+    os.makedirs(os.path.dirname(os.path.abspath(args.times_file)), exist_ok=True)
+    with open(args.times_file, 'w') as f:
+        json.dump(records, f, indent=2)
+    print(f"images ready in {time.time() - start:.0f}s")
+    if len(failed) > 0:
+        raise SystemExit(f"failed to build {', '.join(failed)}")
+
+
+def get_base_image(image):
+    with open(f'docker/Dockerfile.{image}') as f:
+        return re.search(r'^FROM\s+(\S+)', f.read(), re.MULTILINE).group(1)
+
+
+def sort_by_dependencies(images, base_images):
+    ordered = []
+    def visit(image):
+        if image in ordered:
+            return
+        base = base_images[image]
+        if base.startswith('wheel-tester/') and base[len('wheel-tester/'):] in base_images:
+            visit(base[len('wheel-tester/'):])
+        ordered.append(image)
+    for image in images:
+        visit(image)
+    return ordered
+
+
+def get_build_args(image):
+    # the testhost runs as the user of the host, with access to its docker socket
+    if image != 'testhost':
+        return {}
+    return {
+        'USER_GID': str(os.getgid()),
+        'USER_UID': str(os.getuid()),
+        'USER_NAME': subprocess.run(['whoami'], capture_output=True, text=True, check=True).stdout.strip(),
+        'DOCKER_GID': str(os.stat('/var/run/docker.sock').st_gid),
+    }
+
+
+def pull_image(image):
+    subprocess.run(['docker', 'pull', '-q', image], check=True, stdout=subprocess.DEVNULL)
+
+
+def get_build_key(docker_client, image, base, build_args):
+    # an image only needs a rebuild when its base image, Dockerfile or build arguments changed
+    build_key = hashlib.sha256()
+    build_key.update(docker_client.inspect_image(base)['Id'].encode('utf-8'))
+    with open(f'docker/Dockerfile.{image}', 'rb') as f:
+        build_key.update(f.read())
+    build_key.update(json.dumps(build_args, sort_keys=True).encode('utf-8'))
+    return build_key.hexdigest()
+
+
+def get_image_age(image_info):
+    # Created is RFC 3339 with nanoseconds, which strptime does not parse
+    created = datetime.strptime(re.sub(r'\.\d+', '', image_info['Created']), '%Y-%m-%dT%H:%M:%S%z')
+    return (datetime.now(timezone.utc) - created).total_seconds()
+
+
+def build_image(docker_client, image, base, force=False, max_age=MAX_IMAGE_AGE * 24 * 3600):
+    build_args = get_build_args(image)
+    build_key = get_build_key(docker_client, image, base, build_args)
+    record = {'built': False, 'build-time': 0, 'build-key': build_key}
+    expired = False
+    try:
+        image_info = docker_client.inspect_image(f'wheel-tester/{image}')
+        up_to_date = (image_info['Config']['Labels'] or {}).get(BUILD_KEY_LABEL) == build_key
+        expired = get_image_age(image_info) >= max_age
+        if up_to_date and not force and not expired:
+            return record
+    except docker_api.DockerAPIError as e:
+        if e.status != 404:
+            raise
+
+    cmd = ['docker', 'build', '-t', f'wheel-tester/{image}', '-f', f'docker/Dockerfile.{image}',
+           '--label', f'{BUILD_KEY_LABEL}={build_key}']
+    if expired:
+        # the cached layers would keep the packages installed by the previous build
+        cmd.append('--no-cache')
+    for key, value in build_args.items():
+        cmd.extend(['--build-arg', f'{key}={value}'])
+    cmd.append('.')
+    print(f"building wheel-tester/{image}...")
+    start = time.time()
+    # builds run side by side, so their output is only shown when one fails
+    r = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    record['build-time'] = time.time() - start
+    record['built'] = True
+    if r.returncode != 0:
+        print(f"building wheel-tester/{image} failed:\n{r.stdout}")
+        r.check_returncode()
+    return record
+
+
+if __name__ == '__main__':
+    main()
@@ -3,21 +3,65 @@
 import re
 import os
 import json
+import lzma
+import math
 import time
+import glob
 import yaml
+import shutil
+import hashlib
+import requests
+import heapq
+import asyncio
+import statistics
+import contextlib
 import argparse
 import importlib
 import itertools
-import subprocess
-import multiprocessing
+import threading
+import concurrent.futures
 from datetime import datetime
 from collections import defaultdict
 
 process_results = importlib.import_module("process-results")
 generate_website = importlib.import_module("generate-website")
+docker_api = importlib.import_module("docker-api")
+index_proxy = importlib.import_module("index-proxy")
+log_store = importlib.import_module("log-store")
 
 SLOW_INSTALL_TIME = 60
 TIMEOUT = 600
+# Per-test thresholds adapt to the runtimes of the previous runs once there are enough of
+# them, within these bounds; TIMEOUT and SLOW_INSTALL_TIME in packages.yaml override them.
+THRESHOLD_MIN_RUNS = 3
+TIMEOUT_FLOOR = 120
+TIMEOUT_CEILING = TIMEOUT
+SLOW_INSTALL_CEILING = TIMEOUT
+# pip tests may build from source and are CPU-bound; the OS package manager tests mostly wait on I/O
+DEFAULT_MANAGER_LIMITS = {
+    'PIP': os.cpu_count(),
+}
+BATCH_PACKAGE_MANAGERS = ['PIP', 'CONDA']
+OS_PACKAGE_MANAGERS = ['APT', 'YUM']
+WHEEL_CACHE_SIZE = 20
+# number of previous runs whose runtimes are used to plan the schedule
+HISTORY_RUNS = 7
+# logs in the persistent log store that no run produced for this long are removed
+LOG_RETENTION_DAYS = 30
+# container output retained in a result: the first and the last kilobytes of it
+LOG_HEAD_SIZE = 64
+LOG_TAIL_SIZE = 256
+INDEX_PROXY_SIZE = 20
+# a pooled container is replaced after running this many tests
+POOL_RECYCLE = 20
+
+
+def parse_manager_limit(text):
+    try:
+        package_manager, limit = text.split('=')
+        return package_manager.upper(), int(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected PACKAGE_MANAGER=N, got '{text}'")
 
 
 def main():
@@ -27,7 +71,40 @@ def main():
     parser.add_argument('--container', type=str, nargs='*', help='Specify which containers to test')
     parser.add_argument('--packages', type=str, nargs='*', help='Specify which packages to test')
     parser.add_argument('--skip-webpage', action='store_true', help='Do not download history from GitHub to generate the web report')
+    parser.add_argument('--concurrency', type=int, default=os.cpu_count() * 2, help='Maximum number of test containers running at once')
+    parser.add_argument('--manager-limit', type=parse_manager_limit, action='append', default=[], metavar='PACKAGE_MANAGER=N',
+            help='Maximum number of concurrent tests for one package manager (PIP, CONDA, APT, YUM); can be used more than once.')
+    parser.add_argument('--batch-size', type=int, default=1,
+            help='Run up to this many PIP or CONDA package tests one after another in a single container, each in its own environment')
+    parser.add_argument('--cache-dir', type=str, default=None,
+            help='Directory for caches kept across runs; it must have the same path on the docker host and in this container')
+    parser.add_argument('--wheel-cache-size', type=float, default=WHEEL_CACHE_SIZE, help='Size limit of the cache of locally built wheels, in GB')
+    parser.add_argument('--index-proxy', action='store_true', help='Serve PyPI to the test containers through a local caching proxy; requires --cache-dir')
+    parser.add_argument('--index-proxy-upstream', type=str, default=index_proxy.DEFAULT_UPSTREAM, help='Index (or local directory of wheels) behind the proxy')
+    parser.add_argument('--index-proxy-port', type=int, default=index_proxy.DEFAULT_PORT, help='Port of the index proxy')
+    parser.add_argument('--index-proxy-size', type=float, default=INDEX_PROXY_SIZE, help='Size limit of the index proxy artifact cache, in GB')
+    parser.add_argument('--history', type=str, nargs='*', default=[],
+            help='Results files of previous runs, newest first; defaults to the newest results/results-*.json.xz, or to the previous run on GitHub')
+    parser.add_argument('--full', action='store_true', help='Run every test, even those whose previous result could be reused')
+    parser.add_argument('--history-db', type=str, default=None, help='History database the web report reads previous runs from, instead of downloading them')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted run, skipping the tests already in its results journal')
+    parser.add_argument('--log-head-size', type=int, default=LOG_HEAD_SIZE, help='Kilobytes kept from the start of the output of a test')
+    parser.add_argument('--log-tail-size', type=int, default=LOG_TAIL_SIZE, help='Kilobytes kept from the end of the output of a test')
+    parser.add_argument('--keep-full-logs', action='store_true', help='Also store the complete output of tests whose output was truncated')
+    parser.add_argument('--pip-version', type=str, default=None,
+            help='Version of pip the PIP tests run with; by default the one installed in the image when it was built')
+    parser.add_argument('--container-pool', action='store_true',
+            help='Run the PIP and CONDA tests in long-lived containers, one exec per test, instead of a container per test')
+    parser.add_argument('--pool-recycle', type=int, default=POOL_RECYCLE, help='Number of tests after which a pooled container is replaced')
+    parser.add_argument('--report-format', type=str, choices=['html', 'data'], default='html',
+            help="Format of the reports: a single HTML table, or JSON data with a page that renders only the rows in view")
     args = parser.parse_args()
+    history = [os.path.abspath(fname) for fname in args.history]
+    history_db = os.path.abspath(args.history_db) if args.history_db is not None else None
+
+    cache_dir = os.path.abspath(args.cache_dir) if args.cache_dir is not None else None
+    if args.index_proxy and cache_dir is None:
+        parser.error('--index-proxy requires --cache-dir')
 
     # change working directory the path of this script
     os.chdir(os.path.dirname(os.path.realpath(__file__)))
@@ -72,35 +149,100 @@ def main():
             test_shell_script = package_managers[package_manager]
             yield (package_main_name, package_list, container, test_shell_script, py_script, test_name, package_manager)
 
-    results_list = []
-    with multiprocessing.Pool(processes=os.cpu_count(), initializer=do_test_initializer) as pool:
-        for result in pool.imap_unordered(do_test_lambda, get_test_set()):
-            results_list.append(result)
-
-    # cleanup subprocess work directories
-    subprocess.run('rm -rf work_pid*', shell=True)
-
-    results = defaultdict(dict)
-    for result in results_list:
-        results[result['wheel']][result['test-name']] = result
-        del result['wheel']
-        del result['test-name']
+    manager_limits = dict(DEFAULT_MANAGER_LIMITS)
+    manager_limits.update(args.manager_limit)
+    proxy = None
+    pip_index_url = None
+    if args.index_proxy:
+        proxy = index_proxy.IndexProxy(f'{cache_dir}/pypi', args.index_proxy_upstream, int(args.index_proxy_size * 1024**3))
+        proxy.start('0.0.0.0', args.index_proxy_port)
+        pip_index_url = f'http://{index_proxy.get_host_address()}:{args.index_proxy_port}/simple/'
 
     output_dir = 'results'
     try:
         os.mkdir(output_dir)
     except FileExistsError:
         pass
-    with open(f'{output_dir}/results.json', 'w') as f:
-        json.dump(results, f, indent=2)
-    subprocess.run(['xz', 'results.json'], check=True, cwd=output_dir)
+    # container output goes to the content-addressed log store; with a cache directory the
+    # store is kept across runs, and the logs of this run are copied next to its results
+    log_store_dir = f'{cache_dir}/logs' if cache_dir is not None else os.path.abspath(f'{output_dir}/logs')
+    log_capture_args = {
+        'head_bytes': args.log_head_size * 1024,
+        'tail_bytes': args.log_tail_size * 1024,
+        'spill_dir': log_store_dir if args.keep_full_logs else None,
+    }
+
+    # every result is appended to the journal as soon as it is known, so an interrupted run can be resumed
+    journal = ResultsJournal(f'{output_dir}/journal.jsonl', resume=args.resume)
+
+    context = RunContext(docker_api.DockerClient(pool_size=args.concurrency), cache_dir=cache_dir,
+            pip_index_url=pip_index_url, pip_version=args.pip_version,
+            log_store_dir=log_store_dir, log_capture_args=log_capture_args)
+    if args.container_pool:
+        context.container_pool = ContainerPool(context, args.pool_recycle)
+    test_set = [test for test in get_test_set() if (test[0], test[5]) not in journal]
+    if args.resume:
+        print(f"resuming: {len(journal)} results in the journal, running {len(test_set)} tests")
+    for container in set(test[2] for test in test_set):
+        context.image_digests[container] = context.docker_client.inspect_image(f'wheel-tester/{container}')['Id']
+
+    history_files = find_history_files(history, args.token, HISTORY_RUNS, artifact_cache_dir=context.artifact_cache_dir())
+    history_results = [test_results for test_results, _ in process_results.load_result_files(history_files, structured_only=True, cache_dir=cache_dir)]
+
+    reused_results = []
+    if not args.full and len(history_results) > 0:
+        reused_results, test_set = reuse_previous_results(test_set, history_results[0], context.image_digests)
+        print(f"incremental run: reusing {len(reused_results)} results from {history_files[0]}, running {len(test_set)} tests")
+
+    overrides = {re.findall(r'([\S]+)', package['PKG_NAME'])[0]: package for package in packages['packages']}
+    context.test_thresholds.update(get_test_thresholds(test_set, history_results, overrides))
+
+    # start the longest jobs first so a long source build does not start last and stretch the run
+    expected_runtime = get_expected_runtimes(history_results)
+    jobs = make_jobs(test_set, args.batch_size)
+    job_runtimes = [sum(expected_runtime(test) for test in job) for job in jobs]
+    jobs = [job for _, job in sorted(zip(job_runtimes, jobs), key=lambda x: x[0], reverse=True)]
+    predicted_makespan = predict_makespan(job_runtimes, args.concurrency)
+
+    for result in reused_results:
+        journal.append(result)
+    start = time.time()
+    asyncio.run(run_tests(context, jobs, args.concurrency, manager_limits, journal.append))
+    print(f"makespan: predicted {predicted_makespan:.0f}s, actual {time.time() - start:.0f}s")
+    if context.container_pool is not None:
+        context.container_pool.close()
+        context.container_pool.print_stats()
+    context.docker_client.close()
+
+    if proxy is not None:
+        proxy.stop()
+        proxy.print_stats()
+
+    # cleanup test work directories
+    for work_dir in glob.glob('work_*'):
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if cache_dir is not None:
+        prune_wheel_cache(f'{cache_dir}/wheels', int(args.wheel_cache_size * 1024**3))
+
     now = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     new_results_file = f'{output_dir}/results-{now}.json.xz'
-    os.rename(f'{output_dir}/results.json.xz', new_results_file)
+    journal.write_results(new_results_file)
+    journal.remove()
+    if cache_dir is not None:
+        new_results, _ = next(process_results.load_result_files([new_results_file], cache_dir=cache_dir))
+        log_store.copy_logs(log_store_dir, log_store.get_log_hashes(new_results), f'{output_dir}/logs')
+        log_store.prune_logs(log_store_dir, LOG_RETENTION_DAYS)
 
     print("process results...")
     # Also generate an html report of the results
-    html = process_results.print_table_by_distro_report([new_results_file], ignore_tests=args.ignore)
+    if args.report_format == 'data':
+        html, data = process_results.print_data_report([new_results_file], f'report-{now}.json', ignore_tests=args.ignore,
+                cache_dir=cache_dir)
+        with open(f'{output_dir}/report-{now}.json', 'w') as f:
+            f.write(data)
+    else:
+        html = process_results.print_table_by_distro_report([new_results_file], ignore_tests=args.ignore, cache_dir=cache_dir)
     with open(f'{output_dir}/report-{now}.html', 'w') as f:
         f.write(html)
 
@@ -109,26 +251,442 @@ def main():
 
     # Run the GitHub pages generator
     print("generate the website...")
-    generate_website.generate_website(output_dir='build',
+    # with a cache directory the site is kept there and updated in place every night,
+    # then copied to the directory that gets published
+    site_dir = f'{cache_dir}/site' if cache_dir is not None else 'build'
+    generate_website.generate_website(output_dir=site_dir,
             new_results=new_results_file,
             github_token=args.token,
             days_ago_list=[1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 21],
             compare_weekday_num=0,
-            ignore_tests=args.ignore)
-
-
-process_work_dir = ''
-
-
-def do_test_initializer():
-    global process_work_dir
-    process_work_dir = "work_pid_%d" % os.getpid()
-    os.mkdir(process_work_dir)
-    subprocess.run(f'cp container-* {process_work_dir}/', shell=True)
-
-
-def do_test_lambda(x):
-    return do_test(*x)
+            ignore_tests=args.ignore,
+            history_db=history_db,
+            report_format=args.report_format,
+            artifact_cache_dir=context.artifact_cache_dir(),
+            cache_dir=cache_dir)
+    if site_dir != 'build':
+        shutil.copytree(site_dir, 'build', dirs_exist_ok=True)
+
+
+# Everything the tests of a run share: the Engine API client, the cache directory and what the
+# containers are given from it, the thresholds of every test, the digests of the images and
+# where the output goes. main() sets it up and passes it down to the functions running tests.
+class RunContext():
+    def __init__(self, docker_client, cache_dir=None, pip_index_url=None, pip_version=None,
+            log_store_dir=None, log_capture_args={}):
+        self.docker_client = docker_client
+        self.cache_dir = cache_dir
+        self.pip_index_url = pip_index_url
+        self.pip_version = pip_version
+        self.log_store_dir = log_store_dir
+        self.log_capture_args = log_capture_args
+        # set by main() with --container-pool
+        self.container_pool = None
+        # (package main name, test name) -> (timeout, slow install time)
+        self.test_thresholds = {}
+        self.image_digests = {}
+        # images whose shared package index was refreshed by prefetch_os_cache
+        self.os_cache_ready = set()
+
+    def artifact_cache_dir(self):
+        return f'{self.cache_dir}/artifacts' if self.cache_dir is not None else None
+
+
+def find_history_files(history, github_token, count, artifact_cache_dir=None):
+    # returns up to count results files of previous runs, newest first
+    if len(history) > 0:
+        return history[:count]
+    fnames = sorted(glob.glob('results/results-*.json.xz'), reverse=True)[:count]
+    if len(fnames) == 0 and github_token is not None:
+        # the website build prunes the shared artifact cache to its own, longer, window
+        fnames = generate_website.fetch_previous_results(list(range(1, count + 1)), github_token=github_token,
+                cache_dir=artifact_cache_dir, prune_cache=False)
+    return fnames
+
+
+def get_primary_package(package_list):
+    # Primary package assumed the first listed, without extras or version specifiers
+    return re.split(r'[\[<>=!~;]', package_list.split()[0])[0]
+
+
+def get_latest_versions(package_names):
+    def get_latest_version(name):
+        try:
+            r = requests.get(f'https://pypi.org/pypi/{name}/json', timeout=30)
+            return name, r.json()['info']['version']
+        except (requests.RequestException, ValueError, KeyError):
+            return name, None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        return dict(executor.map(get_latest_version, package_names))
+
+
+def get_test_hash(package_list, test_py_script):
+    return hashlib.sha256(f'{package_list}\n{test_py_script}'.encode('utf-8')).hexdigest()
+
+
+def reuse_previous_results(test_set, previous_results, image_digests):
+    # A passing PIP test is carried forward when nothing it depends on changed: the same test
+    # definition, the same image, and the latest release is still the version it installed.
+    # Everything else, including all failures and the OS/conda package tests, runs again.
+    candidates = [test for test in test_set if test[-1] == 'PIP']
+    latest_versions = get_latest_versions(set(get_primary_package(test[1]) for test in candidates))
+    reused_results = []
+    remaining_tests = []
+    for test in test_set:
+        package_main_name, package_list, container, _, test_py_script, test_name, package_manager = test
+        previous = previous_results.get(package_main_name, {}).get(test_name)
+        reusable = (package_manager == 'PIP'
+                and previous is not None
+                and previous['test-passed']
+                and not previous.get('timeout', False)
+                and previous.get('test-hash') == get_test_hash(package_list, test_py_script)
+                and previous.get('image-digest') == image_digests[container]
+                and previous['latest-version'] is not None
+                and previous['installed-version'] == previous['latest-version']
+                and latest_versions.get(get_primary_package(package_list)) == previous['latest-version'])
+        if not reusable:
+            remaining_tests.append(test)
+            continue
+        result = dict(previous)
+        result['reused'] = True
+        result['wheel'] = package_main_name
+        result['test-name'] = test_name
+        reused_results.append(result)
+    return reused_results, remaining_tests
+
+
+def percentile(values, p):
+    # nearest-rank percentile
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def get_test_thresholds(test_set, history_results, overrides):
+    # A test may run twice its 95th percentile runtime plus a minute before it is stopped,
+    # and is flagged as a slow install when it takes 1.5 times its 90th percentile. A timed out
+    # run only says the test needs more than its limit, so a test with a timeout among the
+    # previous runs gets the longest limit for as long as that run is among them.
+    runtimes = defaultdict(list)
+    timed_out = set()
+    for test_results in history_results:
+        for wheel, wheel_dict in test_results.items():
+            for test_name, result in wheel_dict.items():
+                if result.get('timeout', False):
+                    timed_out.add((wheel, test_name))
+                else:
+                    runtimes[(wheel, test_name)].append(result['runtime'])
+    thresholds = {}
+    for test in test_set:
+        package_main_name, test_name = test[0], test[5]
+        values = runtimes[(package_main_name, test_name)]
+        timeout, slow_install_time = TIMEOUT, SLOW_INSTALL_TIME
+        if len(values) >= THRESHOLD_MIN_RUNS:
+            timeout = min(max(2 * percentile(values, 95) + 60, TIMEOUT_FLOOR), TIMEOUT_CEILING)
+            slow_install_time = min(max(1.5 * percentile(values, 90), SLOW_INSTALL_TIME), SLOW_INSTALL_CEILING)
+        if (package_main_name, test_name) in timed_out:
+            timeout = TIMEOUT_CEILING
+        package = overrides.get(package_main_name, {})
+        timeout = package.get('TIMEOUT', timeout)
+        slow_install_time = package.get('SLOW_INSTALL_TIME', slow_install_time)
+        thresholds[(package_main_name, test_name)] = (round(timeout), round(slow_install_time))
+    return thresholds
+
+
+def get_expected_runtimes(history_results):
+    # expected runtime of a test is its median runtime in the previous runs; tests without
+    # history are expected to take as long as the median test of their package manager
+    runtimes = defaultdict(list)
+    for test_results in history_results:
+        for wheel, wheel_dict in test_results.items():
+            for test_name, result in wheel_dict.items():
+                runtimes[(wheel, test_name)].append(result['runtime'])
+    expected = {key: statistics.median(values) for key, values in runtimes.items()}
+    manager_runtimes = defaultdict(list)
+    for (wheel, test_name), runtime in expected.items():
+        manager_runtimes[process_results.get_package_manager_name(test_name)].append(runtime)
+    manager_defaults = {name: statistics.median(values) for name, values in manager_runtimes.items()}
+
+    def expected_runtime(test):
+        package_main_name, test_name, package_manager = test[0], test[5], test[6]
+        default = manager_defaults.get(package_manager.lower(), SLOW_INSTALL_TIME)
+        return expected.get((package_main_name, test_name), default)
+    return expected_runtime
+
+
+def predict_makespan(job_runtimes, concurrency):
+    # list scheduling of the jobs, longest first, onto the concurrency slots; the package
+    # manager limits are not modelled, so this is a lower bound when they are the bottleneck
+    slots = [0.0] * max(1, min(concurrency, len(job_runtimes)))
+    for runtime in sorted(job_runtimes, reverse=True):
+        heapq.heappush(slots, heapq.heappop(slots) + runtime)
+    return max(slots)
+
+
+def make_jobs(test_set, batch_size):
+    # A job is a list of tests sharing one container. Only the PIP and CONDA tests can be
+    # batched, because they install into a venv/env of their own; APT and YUM tests change
+    # the system itself and always get a fresh container.
+    jobs = []
+    batches = defaultdict(list)
+    for test in test_set:
+        container, package_manager = test[2], test[-1]
+        if batch_size <= 1 or package_manager not in BATCH_PACKAGE_MANAGERS:
+            jobs.append([test])
+            continue
+        batch = batches[(container, package_manager)]
+        batch.append(test)
+        if len(batch) == batch_size:
+            jobs.append(batch)
+            batches[(container, package_manager)] = []
+    jobs.extend(batch for batch in batches.values() if len(batch) > 0)
+    return jobs
+
+
+# Append-only JSON lines file holding one result per line. Only the offset of each result
+# is kept in memory; the final results file is written by reading the results back one by one.
+class ResultsJournal():
+    def __init__(self, fname, resume=False):
+        self.fname = fname
+        self.offsets = defaultdict(dict)
+        if resume and os.path.exists(fname):
+            self.load()
+        else:
+            open(fname, 'w').close()
+        self.f = open(fname, 'ab')
+
+    def load(self):
+        offset = 0
+        with open(self.fname, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('incomplete line')
+                    result = json.loads(line)
+                except ValueError:
+                    # the run was interrupted while writing this line
+                    break
+                self.offsets[result['wheel']][result['test-name']] = offset
+                offset += len(line)
+        os.truncate(self.fname, offset)
+
+    def __len__(self):
+        return sum(len(tests) for tests in self.offsets.values())
+
+    def __contains__(self, key):
+        wheel, test_name = key
+        return test_name in self.offsets.get(wheel, {})
+
+    def append(self, result):
+        offset = self.f.seek(0, os.SEEK_END)
+        self.f.write(json.dumps(result).encode('utf-8') + b'\n')
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.offsets[result['wheel']][result['test-name']] = offset
+
+    def write_results(self, fname):
+        # streams the {wheel: {test-name: result}} document into an xz file
+        self.f.flush()
+        with open(self.fname, 'rb') as f, lzma.open(fname, 'wt', encoding='utf-8') as out:
+            out.write('{')
+            for wheel_index, (wheel, tests) in enumerate(self.offsets.items()):
+                separator = ',' if wheel_index > 0 else ''
+                out.write(f'{separator}\n  {json.dumps(wheel)}: {{')
+                for test_index, (test_name, offset) in enumerate(tests.items()):
+                    f.seek(offset)
+                    result = json.loads(f.readline())
+                    del result['wheel']
+                    del result['test-name']
+                    separator = ',' if test_index > 0 else ''
+                    out.write(f'{separator}\n    {json.dumps(test_name)}: {json.dumps(result)}')
+                out.write('\n  }')
+            out.write('\n}\n')
+
+    def remove(self):
+        self.f.close()
+        os.unlink(self.fname)
+
+
+async def run_tests(context, jobs, concurrency, manager_limits, on_result):
+    # Containers are driven from a single process: the event loop decides which test may start,
+    # and the blocking Engine API calls of each running test sit in a thread of their own.
+    loop = asyncio.get_running_loop()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+    slots = asyncio.Semaphore(concurrency)
+    manager_slots = {name: asyncio.Semaphore(limit) for name, limit in manager_limits.items()}
+
+    # with a cache directory, the package index of every image with APT/YUM tests is refreshed
+    # once up front and shared; those tests wait for the refresh of their image
+    os_prefetch = {}
+    if context.cache_dir is not None:
+        package_lists = defaultdict(list)
+        for job in jobs:
+            for test in job:
+                if test[-1] in OS_PACKAGE_MANAGERS:
+                    package_lists[(test[2], test[-1])].append(test[1])
+        for (container, package_manager), lists in package_lists.items():
+            os_prefetch[container] = loop.run_in_executor(executor, prefetch_os_cache, context, container, package_manager, lists)
+
+    async def run_one(index, job):
+        package_manager = job[0][-1]
+        if package_manager in OS_PACKAGE_MANAGERS and job[0][2] in os_prefetch:
+            await os_prefetch[job[0][2]]
+        async with contextlib.AsyncExitStack() as stack:
+            # take the package manager slot first so waiting tests do not hold a global slot
+            if package_manager in manager_slots:
+                await stack.enter_async_context(manager_slots[package_manager])
+            await stack.enter_async_context(slots)
+            if context.container_pool is not None and len(job) == 1 and package_manager in BATCH_PACKAGE_MANAGERS:
+                return [await loop.run_in_executor(executor, do_pooled_test, context, *job[0])]
+            work_dir = make_work_dir(index)
+            if len(job) == 1:
+                return [await loop.run_in_executor(executor, do_test, context, work_dir, *job[0])]
+            return await loop.run_in_executor(executor, do_batch_test, context, work_dir, job)
+
+    # create the tasks in job order: they queue up on the semaphores in the order they start
+    tasks = [asyncio.ensure_future(run_one(index, job)) for index, job in enumerate(jobs)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            for result in await task:
+                on_result(result)
+    finally:
+        executor.shutdown(wait=True)
+
+
+def make_work_dir(index):
+    work_dir = f'work_test_{index}'
+    os.makedirs(work_dir, exist_ok=True)
+    for fname in glob.glob('container-*'):
+        shutil.copy(fname, work_dir)
+    return work_dir
+
+
+# Long-lived containers for --container-pool, per image and package manager. A pooled container
+# only runs `sleep infinity` and every test is an exec in it, so creating, starting and removing
+# a container leaves the path of each test. The tests of a pooled container run one at a time,
+# in the same kind of environment a batch gives them: a directory /io/<n>/, a fresh venv
+# /venvs/<n> or conda environment env-<n>, and a pip cache of its own, all removed by
+# container-pool-cleanup.sh after the test. Anything else a test changes outlives it, so a
+# container is replaced after any failed or timed out test, which may have left processes or
+# files behind, and after POOL_RECYCLE tests in any case. The APT and YUM tests install system
+# packages even when they pass, so they keep a fresh container each.
+class ContainerPool():
+    def __init__(self, context, recycle_after=POOL_RECYCLE):
+        self.context = context
+        self.recycle_after = recycle_after
+        self.idle = defaultdict(list)
+        self.lock = threading.Lock()
+        self.count = 0
+        self.stats = {'started': 0, 'recycled': 0, 'tests': 0}
+
+    def acquire(self, container, package_manager):
+        with self.lock:
+            self.stats['tests'] += 1
+            if len(self.idle[(container, package_manager)]) > 0:
+                return self.idle[(container, package_manager)].pop()
+            self.count += 1
+            self.stats['started'] += 1
+            work_dir = f'work_pool_{self.count}'
+        os.makedirs(work_dir, exist_ok=True)
+        for fname in glob.glob('container-*'):
+            shutil.copy(fname, work_dir)
+        binds, env = container_mounts(self.context, work_dir, container, package_manager)
+        # docker-init as pid 1 reaps the processes orphaned by tests that were killed
+        container_id = self.context.docker_client.run_container(f'wheel-tester/{container}', ['sleep', 'infinity'],
+                env=env, binds=binds, init=True)
+        return {'id': container_id, 'work-dir': work_dir, 'key': (container, package_manager), 'tests': 0}
+
+    def release(self, pooled, recycle=False):
+        pooled['tests'] += 1
+        if recycle or pooled['tests'] >= self.recycle_after:
+            self.remove(pooled)
+            with self.lock:
+                self.stats['recycled'] += 1
+            return
+        with self.lock:
+            self.idle[pooled['key']].append(pooled)
+
+    def remove(self, pooled):
+        self.context.docker_client.remove_container(pooled['id'], force=True)
+        shutil.rmtree(pooled['work-dir'], ignore_errors=True)
+
+    def close(self):
+        with self.lock:
+            idle = [pooled for pooled_list in self.idle.values() for pooled in pooled_list]
+            self.idle.clear()
+        for pooled in idle:
+            self.remove(pooled)
+
+    def print_stats(self):
+        print(f"container pool: {self.stats['tests']} tests in {self.stats['started']} containers, "
+              f"{self.stats['recycled']} recycled")
+
+
+def prefetch_os_cache(context, container, package_manager, package_lists):
+    docker_client = context.docker_client
+    os_cache = f'{context.cache_dir}/os/{container}'
+    os.makedirs(os_cache, exist_ok=True)
+    work_dir = f'work_os_cache_{container}'
+    os.makedirs(work_dir, exist_ok=True)
+    shutil.copy('container-os-cache.sh', work_dir)
+    with open(f'{work_dir}/package-lists', 'w') as f:
+        f.write('\n'.join(package_lists) + '\n')
+    wd = os.environ['WORK_PATH']
+    start = time.time()
+    container_id = docker_client.run_container(f'wheel-tester/{container}',
+            ['bash', '/io/container-os-cache.sh', package_manager],
+            env={'OS_CACHE': '/os-cache'},
+            binds=[f'{wd}/{work_dir}:/io', f'{os_cache}:/os-cache'])
+    return_code = docker_client.wait_container(container_id, timeout=TIMEOUT)
+    if return_code is None:
+        docker_client.stop_container(container_id)
+    docker_client.remove_container(container_id)
+    # without a refreshed index the tests of this image fall back to refreshing it themselves
+    if return_code == 0:
+        context.os_cache_ready.add(container)
+        print(f"{package_manager}: shared package index of {container} ready after {time.time() - start:.0f}s")
+    else:
+        print(f"{package_manager}: failed to refresh the shared package index of {container}")
+
+
+def container_mounts(context, work_dir, container, package_manager):
+    cache_dir, pip_index_url = context.cache_dir, context.pip_index_url
+    wd = os.environ['WORK_PATH']
+    binds = [f'{wd}/{work_dir}:/io']
+    env = {}
+    if container in context.os_cache_ready and package_manager in OS_PACKAGE_MANAGERS:
+        binds.append(f'{cache_dir}/os/{container}:/os-cache:ro')
+        env['OS_CACHE'] = '/os-cache'
+    if cache_dir is not None:
+        # built wheels only fit the image (and its python) that built them
+        wheel_cache = f'{cache_dir}/wheels/{container}'
+        os.makedirs(wheel_cache, exist_ok=True)
+        binds.append(f'{wheel_cache}:/wheel-cache')
+        env['WHEEL_CACHE'] = '/wheel-cache'
+    if context.pip_version is not None and package_manager == 'PIP':
+        env['PINNED_PIP_VERSION'] = context.pip_version
+    if pip_index_url is not None:
+        env['PIP_INDEX_URL'] = pip_index_url
+        env['PIP_TRUSTED_HOST'] = pip_index_url.split('/')[2].split(':')[0]
+    return binds, env
+
+
+def prune_wheel_cache(wheel_cache, max_bytes):
+    # entries are wheels/<image>/<SOABI>/<name>-<version>-<sdist sha256>/; the container
+    # touches an entry whenever it is used, so the oldest modification time goes first
+    entries = []
+    for entry_dir in glob.glob(f'{wheel_cache}/*/*/*/'):
+        size = sum(os.path.getsize(fname) for fname in glob.glob(f'{entry_dir}/*'))
+        entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+    total_size = sum(entry[1] for entry in entries)
+    evicted = 0
+    for mtime, size, entry_dir in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total_size -= size
+        evicted += 1
+    print(f"wheel cache: {len(entries) - evicted} entries, {total_size / 1024**2:.1f} MB, evicted {evicted}")
 
 
 def process_pip_report(report, package):
@@ -150,8 +708,9 @@ def process_pip_report(report, package):
     return result
 
 
-def do_test(package_main_name, package_list, container, test_sh_script, test_py_script, test_name, package_manager):
-    result = {
+def new_result(context, package_main_name, package_list, container, test_py_script, test_name):
+    timeout, slow_install_time = context.test_thresholds.get((package_main_name, test_name), (TIMEOUT, SLOW_INSTALL_TIME))
+    return {
         'test-passed': False,
         'build-required': False,
         'binary-wheel': False,
@@ -160,73 +719,213 @@ def do_test(package_main_name, package_list, container, test_sh_script, test_py_
         'installed-version': None,
         'timeout': False,
         'runtime': 0,
+        'timeout-threshold': timeout,
+        'slow-install-threshold': slow_install_time,
+        'wheel-cache-hit': False,
+        'reused': False,
+        'output-truncated-bytes': 0,
+        'test-hash': get_test_hash(package_list, test_py_script),
+        'image-digest': context.image_digests.get(container),
         'wheel': package_main_name,
         'test-name': test_name,
     }
-    with open(f'{process_work_dir}/test-script.py', 'w') as f:
-        f.write(test_py_script)
-    wd = os.environ['WORK_PATH']
-    start = time.time()
-    proc = subprocess.run(['docker', 'run',
-            '-d', '-v', f'{wd}/{process_work_dir}:/io',
-            '--env', f'PACKAGE_LIST={package_list}',
-            f'wheel-tester/{container}',
-            'bash', f'/io/{test_sh_script}'],
-            encoding='utf-8', stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    container_id = proc.stdout.strip()
-
-    # wait until the timeout for the container to complete
-    while True:
-        time.sleep(1)
-        runtime = time.time() - start
-        proc = subprocess.run(['docker', 'container', 'inspect', '-f', '{{ .State.Running }}', container_id],
-                encoding='utf-8', stdout=subprocess.PIPE)
-        if proc.stdout.strip() != "true":
-            result['runtime'] = runtime
-            break
-        elif runtime > TIMEOUT:
-            result['timeout'] = True
-            result['runtime'] = runtime
-            subprocess.run(['docker', 'stop', container_id])
-            print(f"{package_manager}: Package {package_main_name} on {test_name} TIMED OUT!!")
-            break
 
-    proc = subprocess.run(['docker', 'container', 'inspect', '-f', '{{ .State.ExitCode }}', container_id],
-            encoding='utf-8', stdout=subprocess.PIPE)
-    return_code = int(proc.stdout.strip())
-    proc = subprocess.run(['docker', 'logs', container_id],
-            encoding='utf-8', stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    output = proc.stdout
 
-    if time.time() - start > SLOW_INSTALL_TIME:
+def new_log_capture(context, package_main_name):
+    # the patterns classify_result looks for, matched line by line while the output streams in
+    patterns = {
+        'build-required': r'Building wheel for',
+        'wheel-cache-hit': r'Wheel cache: using previously built wheel',
+        # pip prints the file name for files.pythonhosted.org, and the whole link for any other
+        # host such as the index proxy
+        'binary-wheel': rf'Downloading (\S*/)?{re.escape(package_main_name)}-[^/\s]*aarch64[^/\s]*\.whl',
+    }
+    return log_store.LogCapture(patterns, **context.log_capture_args)
+
+
+def is_timeout(result, return_code):
+    # `timeout --kill-after` exits with 124 when the test stopped on SIGTERM and with 137 when it
+    # had to be killed; 137 is any SIGKILL, the OOM killer's too, so it only counts once the time was up
+    return return_code == 124 or (return_code == 137 and result['runtime'] >= result['timeout-threshold'])
+
+
+def classify_result(context, result, return_code, capture, test_dir, package_list):
+    if result['runtime'] > result['slow-install-threshold']:
         result['slow-install'] = True
 
     if not result['timeout'] and return_code == 0:
         result['test-passed'] = True
 
-    if re.search(r'Building wheel for', output) is not None:
+    if 'build-required' in capture.matched:
         result['build-required'] = True
 
-    if re.search(f'Downloading {package_main_name}[^\n]*aarch64[^\n]*whl', output) is not None:
+    # a build served from the wheel cache still means no usable wheel was published
+    if 'wheel-cache-hit' in capture.matched:
+        result['build-required'] = True
+        result['wheel-cache-hit'] = True
+
+    if 'binary-wheel' in capture.matched:
         result['binary-wheel'] = True
 
-    # Primary package assumed the first listed
-    primary_package = package_list.split()[0] 
-    if latest_version := process_pip_report(f"{process_work_dir}/pip_latest.json", primary_package):
+    primary_package = get_primary_package(package_list)
+    if latest_version := process_pip_report(f"{test_dir}/pip_latest.json", primary_package):
         result["latest-version"] = latest_version
-    if binary_version := process_pip_report(f"{process_work_dir}/pip_binary.json", primary_package):
+    if binary_version := process_pip_report(f"{test_dir}/pip_binary.json", primary_package):
         result['installed-version'] = binary_version
 
-    result['output'] = output
+    result['output-hash'] = log_store.store_log(context.log_store_dir, capture.text())
+    result['output-truncated-bytes'] = capture.truncated_bytes
+    if capture.full_hash is not None:
+        result['full-output-hash'] = capture.full_hash
+
+
+def do_test(context, work_dir, package_main_name, package_list, container, test_sh_script, test_py_script, test_name, package_manager):
+    docker_client = context.docker_client
+    result = new_result(context, package_main_name, package_list, container, test_py_script, test_name)
+    with open(f'{work_dir}/test-script.py', 'w') as f:
+        f.write(test_py_script)
+    binds, env = container_mounts(context, work_dir, container, package_manager)
+    env['PACKAGE_LIST'] = package_list
+    start = time.time()
+    container_id = docker_client.run_container(f'wheel-tester/{container}',
+            ['bash', f'/io/{test_sh_script}'],
+            env=env,
+            binds=binds)
+
+    # block until the container exits; the wait request returns as soon as it does
+    return_code = docker_client.wait_container(container_id, timeout=result['timeout-threshold'])
+    result['runtime'] = time.time() - start
+    if return_code is None:
+        result['timeout'] = True
+        docker_client.stop_container(container_id)
+        print(f"{package_manager}: Package {package_main_name} on {test_name} TIMED OUT!!")
+        return_code = docker_client.inspect_container(container_id)['State']['ExitCode']
+    capture = new_log_capture(context, package_main_name)
+    for data in docker_client.iter_logs(container_id):
+        capture.feed(data)
+    capture.close()
+
+    classify_result(context, result, return_code, capture, work_dir, package_list)
 
     outcome = "passed" if result['test-passed'] else "failed"
     print(f"{package_manager}: Package {package_main_name} on {test_name} {outcome}.")
 
-    subprocess.run(['docker', 'container', 'rm', container_id],
-            encoding='utf-8', stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    docker_client.remove_container(container_id)
 
     return result
 
 
+def do_pooled_test(context, package_main_name, package_list, container, test_sh_script, test_py_script, test_name, package_manager):
+    docker_client, container_pool = context.docker_client, context.container_pool
+    result = new_result(context, package_main_name, package_list, container, test_py_script, test_name)
+    pooled = container_pool.acquire(container, package_manager)
+    n = pooled['tests']
+    test_dir = f"{pooled['work-dir']}/{n}"
+    os.makedirs(test_dir, exist_ok=True)
+    with open(f'{test_dir}/test-script.py', 'w') as f:
+        f.write(test_py_script)
+    env = {
+        'PACKAGE_LIST': package_list,
+        'TEST_DIR': f'/io/{n}',
+        'TEST_VENV': f'/venvs/{n}',
+        'CONDA_ENV': f'env-{n}',
+        'PIP_CACHE_DIR': f'/io/{n}/.pip-cache',
+    }
+    start = time.time()
+    try:
+        exec_id = docker_client.create_exec(pooled['id'],
+                ['timeout', '--kill-after=10', str(result['timeout-threshold']), 'bash', f'/io/{test_sh_script}'],
+                env=env)
+        capture = new_log_capture(context, package_main_name)
+        for data in docker_client.iter_exec(exec_id):
+            capture.feed(data)
+        capture.close()
+        result['runtime'] = time.time() - start
+        return_code = docker_client.exec_exit_code(exec_id)
+    except Exception:
+        # the state of the container is unknown, it must not run another test
+        container_pool.release(pooled, recycle=True)
+        raise
+    if is_timeout(result, return_code):
+        result['timeout'] = True
+        print(f"{package_manager}: Package {package_main_name} on {test_name} TIMED OUT!!")
+
+    classify_result(context, result, return_code, capture, test_dir, package_list)
+
+    outcome = "passed" if result['test-passed'] else "failed"
+    print(f"{package_manager}: Package {package_main_name} on {test_name} {outcome}.")
+
+    # any abnormal exit, such as the OOM killer stopping the test, replaces the container too
+    recycle = not result['test-passed']
+    if not recycle:
+        cleanup_code, _ = docker_client.run_exec(pooled['id'], ['bash', '/io/container-pool-cleanup.sh'], env=env)
+        recycle = cleanup_code != 0
+    container_pool.release(pooled, recycle=recycle)
+
+    return result
+
+
+def do_batch_test(context, work_dir, tests):
+    # every test of the batch gets a numbered directory below the work directory; the batch
+    # script runs them in order and leaves exit-code, runtime and output.log in each of them
+    docker_client = context.docker_client
+    container, test_sh_script, package_manager = tests[0][2], tests[0][3], tests[0][-1]
+    results = []
+    for index, (package_main_name, package_list, _, _, test_py_script, test_name, _) in enumerate(tests):
+        test_dir = f'{work_dir}/{index}'
+        os.makedirs(test_dir, exist_ok=True)
+        result = new_result(context, package_main_name, package_list, container, test_py_script, test_name)
+        with open(f'{test_dir}/test-script.py', 'w') as f:
+            f.write(test_py_script)
+        with open(f'{test_dir}/package-list', 'w') as f:
+            f.write(package_list)
+        with open(f'{test_dir}/timeout', 'w') as f:
+            f.write(str(result['timeout-threshold']))
+        results.append(result)
+
+    binds, env = container_mounts(context, work_dir, container, package_manager)
+    env['BATCH_TEST_SCRIPT'] = test_sh_script
+    container_id = docker_client.run_container(f'wheel-tester/{container}',
+            ['bash', '/io/container-batch.sh'],
+            env=env,
+            binds=binds)
+    # each test is bounded by its own timeout inside the container, this is only a safety net
+    batch_timeout = sum(result['timeout-threshold'] for result in results) + 60
+    return_code = docker_client.wait_container(container_id, timeout=batch_timeout)
+    if return_code is None:
+        docker_client.stop_container(container_id)
+    docker_client.remove_container(container_id)
+
+    for index, (package_main_name, package_list, _, _, test_py_script, test_name, _) in enumerate(tests):
+        test_dir = f'{work_dir}/{index}'
+        result = results[index]
+        try:
+            with open(f'{test_dir}/exit-code') as f:
+                return_code = int(f.read().strip())
+            with open(f'{test_dir}/runtime') as f:
+                test_start, test_end = map(float, f.read().split())
+            result['runtime'] = test_end - test_start
+        except (OSError, ValueError):
+            # the batch container was stopped before this test finished, or never ran it
+            return_code = None
+        if is_timeout(result, return_code):
+            result['timeout'] = True
+            print(f"{package_manager}: Package {package_main_name} on {test_name} TIMED OUT!!")
+        capture = new_log_capture(context, package_main_name)
+        try:
+            with open(f'{test_dir}/output.log', 'rb') as f:
+                capture.feed_file(f)
+        except OSError:
+            pass
+        capture.close()
+
+        classify_result(context, result, return_code, capture, test_dir, package_list)
+
+        outcome = "passed" if result['test-passed'] else "failed"
+        print(f"{package_manager}: Package {package_main_name} on {test_name} {outcome}.")
+
+    return results
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,27 @@
+import os
+import sys
+import importlib
+
+import pytest
+
+# the harness scripts live one directory up and are imported by their file names
+TEST_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, TEST_DIR)
+
+docker_api = importlib.import_module("docker-api")
+fake_docker = importlib.import_module("fake-docker")
+
+
+@pytest.fixture
+def fake(tmp_path):
+    fake = fake_docker.FakeDocker(str(tmp_path / 'docker.sock'))
+    fake.start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def client(fake):
+    client = docker_api.DockerClient(socket_path=fake.socket_path)
+    yield client
+    client.close()
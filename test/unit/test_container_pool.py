@@ -0,0 +1,155 @@
+import os
+import glob
+import shutil
+import importlib
+
+import pytest
+
+from conftest import TEST_DIR
+
+test_packages = importlib.import_module("test-packages")
+log_store = importlib.import_module("log-store")
+
+# Stands in for container-script.sh: leaves behind everything a pip or conda test creates
+# outside its directory, prints where, and passes, fails or hangs depending on PACKAGE_LIST.
+FAKE_TEST_SCRIPT = '''#!/bin/bash
+
+set -e
+
+mkdir -p $TEST_VENV/bin && touch $TEST_VENV/bin/python3
+mkdir -p $PIP_CACHE_DIR/wheels && touch $PIP_CACHE_DIR/wheels/cached.whl
+source $HOME/anaconda/etc/profile.d/conda.sh
+conda create -n $CONDA_ENV
+cd $TEST_DIR
+echo "created $TEST_DIR $TEST_VENV $PIP_CACHE_DIR $HOME/anaconda/envs/$CONDA_ENV"
+case "$PACKAGE_LIST" in
+    fail) exit 1 ;;
+    hang) sleep 60 ;;
+    ignore-sigterm) trap '' TERM; sleep 60 ;;
+    killed) kill -9 $$ ;;
+esac
+python3 test-script.py
+'''
+
+# the part of conda the test and cleanup scripts use
+FAKE_CONDA = '''conda() {
+    case "$1" in
+        create) mkdir -p $HOME/anaconda/envs/${@: -1} ;;
+        env) rm -rf $HOME/anaconda/envs/${@: -1} ;;
+    esac
+}
+'''
+
+
+@pytest.fixture
+def context(fake, client, tmp_path, monkeypatch):
+    image_dir = tmp_path / 'image'
+    os.makedirs(image_dir / 'root/anaconda/etc/profile.d')
+    (image_dir / 'root/anaconda/etc/profile.d/conda.sh').write_text(FAKE_CONDA)
+    fake.images = {'wheel-tester/jammy': str(image_dir)}
+
+    work_path = tmp_path / 'work'
+    os.makedirs(work_path)
+    for fname in glob.glob(f'{TEST_DIR}/container-*'):
+        shutil.copy(fname, work_path)
+    (work_path / 'container-fake-test.sh').write_text(FAKE_TEST_SCRIPT)
+    monkeypatch.chdir(work_path)
+    monkeypatch.setenv('WORK_PATH', str(work_path))
+
+    context = test_packages.RunContext(client, log_store_dir=str(tmp_path / 'logs'))
+    context.container_pool = test_packages.ContainerPool(context, recycle_after=3)
+    yield context
+    context.container_pool.close()
+
+
+@pytest.fixture
+def pool(context):
+    return context.container_pool
+
+
+def run_test(context, package_list, timeout=30):
+    context.test_thresholds[('pkg', 'jammy')] = (timeout, 60)
+    return test_packages.do_pooled_test(context, 'pkg', package_list, 'jammy', 'container-fake-test.sh', 'print("ok")', 'jammy', 'PIP')
+
+
+def created_paths(context, result):
+    # the host paths the fake test script reported creating
+    output = log_store.read_log(context.log_store_dir, result['output-hash'])
+    line = next(line for line in output.splitlines() if line.startswith('created '))
+    return line.split()[1:]
+
+
+def idle_containers(pool):
+    return pool.idle[('jammy', 'PIP')]
+
+
+def test_cleanup_removes_everything_a_test_created(fake, context, pool):
+    results = [run_test(context, 'pass') for _ in range(2)]
+    assert all(result['test-passed'] and not result['timeout'] for result in results)
+    # both tests ran in the same container, one after the other
+    assert pool.stats['started'] == 1
+    [pooled] = idle_containers(pool)
+    root = fake.containers[pooled['id']]['root']
+    for n, result in enumerate(results):
+        paths = created_paths(context, result)
+        assert paths == [f"{os.getcwd()}/{pooled['work-dir']}/{n}", f'{root}/venvs/{n}',
+                         f"{os.getcwd()}/{pooled['work-dir']}/{n}/.pip-cache", f'{root}/root/anaconda/envs/env-{n}']
+        for path in paths:
+            assert not os.path.exists(path)
+    # the container itself is left as the image made it
+    assert os.path.exists(f'{root}/root/anaconda/etc/profile.d/conda.sh')
+    assert os.listdir(f'{root}/venvs') == []
+    assert os.listdir(f'{root}/root/anaconda/envs') == []
+
+
+def test_failed_test_recycles_the_container(fake, context, pool):
+    assert run_test(context, 'pass')['test-passed']
+    [pooled] = idle_containers(pool)
+    result = run_test(context, 'fail')
+    assert not result['test-passed'] and not result['timeout']
+    # the failed test may have left anything behind, so its container is gone
+    assert pooled['id'] not in fake.containers
+    assert not os.path.exists(pooled['work-dir'])
+    assert idle_containers(pool) == []
+    assert run_test(context, 'pass')['test-passed']
+    assert pool.stats['started'] == 2
+    assert pool.stats['recycled'] == 1
+
+
+def test_container_is_recycled_after_recycle_after_tests(fake, context, pool):
+    for _ in range(4):
+        assert run_test(context, 'pass')['test-passed']
+    assert pool.stats['started'] == 2
+    assert pool.stats['recycled'] == 1
+    assert len(fake.containers) == 1
+
+
+def test_timed_out_test_recycles_the_container(fake, context, pool):
+    result = run_test(context, 'hang', timeout=1)
+    assert result['timeout'] and not result['test-passed']
+    assert idle_containers(pool) == []
+    assert fake.containers == {}
+
+
+def test_test_killed_after_its_timeout_is_a_timeout(fake, context, pool):
+    # timeout gives up on SIGTERM after --kill-after=10 seconds and exits with 137
+    result = run_test(context, 'ignore-sigterm', timeout=1)
+    assert result['timeout'] and not result['test-passed']
+    assert 10 < result['runtime'] < 20
+    assert fake.containers == {}
+
+
+def test_test_killed_before_its_timeout_is_a_failure(fake, context, pool):
+    # like a test stopped by the OOM killer: 137, long before the timeout
+    result = run_test(context, 'killed')
+    assert not result['timeout'] and not result['test-passed']
+    assert idle_containers(pool) == []
+    assert fake.containers == {}
+
+
+def test_close_removes_the_idle_containers(fake, context, pool):
+    run_test(context, 'pass')
+    assert len(fake.containers) == 1
+    pool.close()
+    assert fake.containers == {}
+    assert glob.glob('work_pool_*') == []
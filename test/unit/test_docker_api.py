@@ -0,0 +1,88 @@
+import json
+import time
+import importlib
+
+import pytest
+
+docker_api = importlib.import_module("docker-api")
+
+
+def test_run_wait_and_logs(client):
+    container_id = client.run_container('wheel-tester/jammy', ['bash', '-c', 'echo out; echo err >&2; exit 3'])
+    assert client.wait_container(container_id, timeout=10) == 3
+    assert client.inspect_container(container_id)['State']['ExitCode'] == 3
+    assert sorted(client.logs(container_id).splitlines()) == ['err', 'out']
+    client.remove_container(container_id)
+
+
+def test_logs_are_demultiplexed(client):
+    # enough output for many frames; no frame header may end up in the payload
+    container_id = client.run_container('wheel-tester/jammy', ['bash', '-c', 'for i in $(seq 20000); do echo line $i; echo error $i >&2; done'])
+    assert client.wait_container(container_id, timeout=30) == 0
+    lines = b''.join(client.iter_logs(container_id)).decode('utf-8').splitlines()
+    assert sorted(lines) == sorted([f'line {i}' for i in range(1, 20001)] + [f'error {i}' for i in range(1, 20001)])
+    client.remove_container(container_id)
+
+
+def test_wait_timeout(client):
+    container_id = client.run_container('wheel-tester/jammy', ['sleep', '30'])
+    start = time.time()
+    assert client.wait_container(container_id, timeout=0.5) is None
+    assert time.time() - start < 5
+    assert client.inspect_container(container_id)['State']['Running']
+    client.stop_container(container_id, timeout=1)
+    # the connection given up on is not reused; the next requests still get their own answers
+    assert client.wait_container(container_id, timeout=10) == 143
+    assert not client.inspect_container(container_id)['State']['Running']
+    client.remove_container(container_id)
+
+
+def test_wait_returns_when_the_container_exits(client):
+    container_id = client.run_container('wheel-tester/jammy', ['sleep', '0.5'])
+    start = time.time()
+    assert client.wait_container(container_id, timeout=10) == 0
+    assert 0.4 < time.time() - start < 5
+    client.remove_container(container_id)
+
+
+def test_exec(client):
+    container_id = client.run_container('wheel-tester/jammy', ['sleep', 'infinity'], env={'A': 'container'}, init=True)
+    assert client.run_exec(container_id, ['bash', '-c', 'echo $A $B; exit 5'], env={'B': 'exec'}) == (5, 'container exec\n')
+    exec_id = client.create_exec(container_id, ['bash', '-c', 'head -c 300000 /dev/zero | tr "\\0" a; echo err >&2'])
+    output = b''.join(client.iter_exec(exec_id))
+    assert output.replace(b'err\n', b'', 1) == b'a' * 300000
+    assert client.exec_exit_code(exec_id) == 0
+    assert client.inspect_container(container_id)['State']['Running']
+    client.remove_container(container_id, force=True)
+
+
+def test_remove(client):
+    container_id = client.run_container('wheel-tester/jammy', ['sleep', 'infinity'])
+    with pytest.raises(docker_api.DockerAPIError) as e:
+        client.remove_container(container_id)
+    assert e.value.status == 409
+    client.remove_container(container_id, force=True)
+    with pytest.raises(docker_api.DockerAPIError) as e:
+        client.inspect_container(container_id)
+    assert e.value.status == 404
+
+
+def test_unknown_image(fake, client):
+    fake.images = {'wheel-tester/jammy': None}
+    assert client.inspect_image('wheel-tester/jammy')['Id'].startswith('sha256:')
+    with pytest.raises(docker_api.DockerAPIError) as e:
+        client.create_container('wheel-tester/unknown', ['true'])
+    assert e.value.status == 404
+
+
+def test_wait_headers_arrive_before_the_exit(client):
+    # the daemon answers a wait right away and only sends the body when the container exits
+    container_id = client.run_container('wheel-tester/jammy', ['sleep', '2'])
+    start = time.time()
+    conn, response = client._send('POST', f'/containers/{container_id}/wait')
+    assert response.status == 200
+    assert time.time() - start < 1
+    assert json.loads(response.read())['StatusCode'] == 0
+    assert time.time() - start > 1.5
+    conn.close()
+    client.remove_container(container_id)
@@ -0,0 +1,97 @@
+import os
+import glob
+import importlib
+from datetime import datetime, timedelta
+
+import pytest
+
+generate_website = importlib.import_module("generate-website")
+fake_github = importlib.import_module("fake-github")
+
+
+@pytest.fixture
+def github(monkeypatch):
+    # two artifacts a page, so a few runs already span several pages
+    fake = fake_github.FakeGitHub(max_per_page=2)
+    fake.start()
+    monkeypatch.setenv('GITHUB_API_URL', fake.url)
+    monkeypatch.setenv('GITHUB_REPOSITORY', 'owner/repo')
+    yield fake
+    fake.stop()
+
+
+def add_run(github, days_ago, **kwargs):
+    # the artifact of a run, its results file larger than a chunk of the download
+    created_at = datetime.utcnow() - timedelta(days=days_ago)
+    content = os.urandom(3 * fake_github.CHUNK_SIZE)
+    fname = f"results-{created_at.strftime('%Y-%m-%d-%H%M%S')}.json.xz"
+    kwargs.setdefault('files', {'logs/output.txt': b'output', fname: content})
+    artifact = github.add_artifact(created_at, **kwargs)
+    return content, artifact
+
+
+def read(fname):
+    with open(fname, 'rb') as f:
+        return f.read()
+
+
+def listing_requests(github):
+    return [path for path in github.requests if path.split('?')[0].endswith('/actions/artifacts')]
+
+
+def download_requests(github):
+    return [path for path in github.requests if path.startswith('/blobs/')]
+
+
+def test_newest_run_before_each_day(github):
+    runs = [add_run(github, days_ago) for days_ago in [0.1, 1.5, 2.5, 3.5, 4.5, 5.5, 6.5]]
+    fnames = generate_website.fetch_previous_results([3, 1], None)
+    assert [read(fname) for fname in fnames] == [runs[1][0], runs[3][0]]
+    # the second page reaches back past three days ago, the pages after it are not read
+    assert len(listing_requests(github)) == 2
+    assert sorted(download_requests(github)) == [f"/blobs/{runs[1][1]['id']}.zip", f"/blobs/{runs[3][1]['id']}.zip"]
+
+
+def test_expired_and_damaged_artifacts_are_skipped(github):
+    fallback, _ = add_run(github, 1.6)
+    _, expired = add_run(github, 1.5, expired=True)
+    add_run(github, 3.5, data=b'not a zip')
+    add_run(github, 5.5, files={'logs/output.txt': b'output'})
+    fnames = generate_website.fetch_previous_results([1, 3, 5], None)
+    # the expired run is passed over for the one before it, the others have no results
+    assert [read(fname) for fname in fnames] == [fallback]
+    assert not any(f"/{expired['id']}/" in path for path in github.requests)
+
+
+def test_cache_is_reused_and_pruned(github, tmp_path, capsys):
+    cache_dir = str(tmp_path / 'artifacts')
+    runs = [add_run(github, days_ago) for days_ago in [1.5, 3.5]]
+    contents = [content for content, _ in runs]
+    fnames = generate_website.fetch_previous_results([1, 3], None, cache_dir=cache_dir)
+    assert [read(fname) for fname in fnames] == contents
+    assert 'artifact cache: 0 hits, 2 misses, 0 pruned' in capsys.readouterr().out
+    assert len(download_requests(github)) == 2
+
+    # a second build reads them from the cache
+    fnames = generate_website.fetch_previous_results([1, 3], None, cache_dir=cache_dir)
+    assert [read(fname) for fname in fnames] == contents
+    assert 'artifact cache: 2 hits, 0 misses, 0 pruned' in capsys.readouterr().out
+    assert len(download_requests(github)) == 2
+
+    # a cached file that no longer matches its manifest is downloaded again
+    with open(fnames[0], 'r+b') as f:
+        f.write(b'damaged')
+    fnames = generate_website.fetch_previous_results([1, 3], None, cache_dir=cache_dir)
+    assert [read(fname) for fname in fnames] == contents
+    assert 'artifact cache: 1 hits, 1 misses, 0 pruned' in capsys.readouterr().out
+    assert len(download_requests(github)) == 3
+
+    # runs older than the oldest day asked for leave the cache
+    generate_website.fetch_previous_results([1], None, cache_dir=cache_dir)
+    assert 'artifact cache: 1 hits, 0 misses, 1 pruned' in capsys.readouterr().out
+    assert [os.path.dirname(fname) for fname in glob.glob(f'{cache_dir}/*/*.json.xz')] == [os.path.dirname(fnames[0])]
+
+
+def test_no_github_api(monkeypatch):
+    monkeypatch.delenv('GITHUB_API_URL', raising=False)
+    assert generate_website.fetch_previous_results([1], None) == []
@@ -0,0 +1,142 @@
+import os
+import re
+import socket
+import functools
+import threading
+import importlib
+import http.server
+import urllib.error
+import urllib.request
+
+import pytest
+
+index_proxy = importlib.import_module("index-proxy")
+
+FILES = {
+    'foo-1.0-py3-none-any.whl': b'w' * 1000,
+    'foo-1.0.tar.gz': b's' * 1000,
+    'foo_bar-2.0-py3-none-any.whl': b'b' * 1000,
+    'foo-bar-2.0.tar.gz': b'c' * 1000,
+}
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    # a static PEP 503 index, its pages linking to the files with relative links
+    root = tmp_path / 'upstream'
+    os.makedirs(root / 'packages')
+    for fname, data in FILES.items():
+        (root / 'packages' / fname).write_bytes(data)
+    for project in ['foo', 'foo-bar']:
+        links = [f'<a href="../../packages/{fname}#sha256=0">{fname}</a><br/>' for fname in FILES
+                 if index_proxy.get_project_name(fname) == project]
+        os.makedirs(root / 'simple' / project)
+        (root / 'simple' / project / 'index.html').write_text('<html><body>' + '\n'.join(links) + '</body></html>')
+    handler = functools.partial(QuietHandler, directory=str(root))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/simple/'
+    server.shutdown()
+    server.server_close()
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_proxy(tmp_path, upstream, max_bytes=10**6):
+    proxy = index_proxy.IndexProxy(str(tmp_path / 'cache'), upstream, max_bytes)
+    proxy.start('127.0.0.1', 0)
+    return proxy, f'http://127.0.0.1:{proxy.server.server_address[1]}'
+
+
+def get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=30) as r:
+            return r.status, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def file_links(proxy_url, project):
+    status, page = get(f'{proxy_url}/simple/{project}/')
+    assert status == 200
+    return {fname: href.split('#')[0] for href, fname in re.findall(r'<a href="([^"]+)">([^<]+)</a>', page.decode('utf-8'))}
+
+
+def test_miss_then_hit(tmp_path, upstream):
+    proxy, proxy_url = start_proxy(tmp_path, upstream)
+    links = file_links(proxy_url, 'foo')
+    assert sorted(links) == ['foo-1.0-py3-none-any.whl', 'foo-1.0.tar.gz']
+    for _ in range(2):
+        assert get(proxy_url + links['foo-1.0-py3-none-any.whl']) == (200, FILES['foo-1.0-py3-none-any.whl'])
+    assert proxy.stats['misses'] == 1
+    assert proxy.stats['hits'] == 1
+    assert proxy.stats['bytes-fetched'] == 1000
+    assert proxy.stats['bytes-served'] == 2000
+    proxy.stop()
+
+
+def test_eviction_at_max_bytes(tmp_path, upstream):
+    proxy, proxy_url = start_proxy(tmp_path, upstream, max_bytes=1500)
+    links = file_links(proxy_url, 'foo')
+    assert get(proxy_url + links['foo-1.0-py3-none-any.whl'])[0] == 200
+    assert get(proxy_url + links['foo-1.0.tar.gz'])[0] == 200
+    assert proxy.stats['evictions'] == 1
+    assert proxy.total_size == 1000
+    # the least recently used file went, so it is fetched again
+    assert get(proxy_url + links['foo-1.0-py3-none-any.whl'])[0] == 200
+    assert proxy.stats['misses'] == 3
+    proxy.stop()
+
+
+def test_files_only_come_from_the_hosts_of_the_index(tmp_path, upstream):
+    proxy, proxy_url = start_proxy(tmp_path, upstream)
+    file_links(proxy_url, 'foo')
+    # the same files, asked for through a host the index never linked to
+    other_base = index_proxy.encode_base_url(upstream.replace('127.0.0.1', 'localhost').replace('/simple/', '/packages'))
+    assert get(f'{proxy_url}/files/{other_base}/foo-1.0.tar.gz') == (404, None)
+    assert proxy.stats['misses'] == 0
+    proxy.stop()
+
+
+def test_local_directory_goes_through_the_cache(tmp_path):
+    wheel_dir = tmp_path / 'wheels'
+    os.makedirs(wheel_dir)
+    for fname, data in FILES.items():
+        (wheel_dir / fname).write_bytes(data)
+    (tmp_path / 'secret.txt').write_text('secret')
+    (wheel_dir / '.hidden').write_text('hidden')
+    proxy, proxy_url = start_proxy(tmp_path, str(wheel_dir))
+    # foo-bar files are not on the foo page
+    links = file_links(proxy_url, 'foo')
+    assert sorted(links) == ['foo-1.0-py3-none-any.whl', 'foo-1.0.tar.gz']
+    assert sorted(file_links(proxy_url, 'foo_bar')) == ['foo-bar-2.0.tar.gz', 'foo_bar-2.0-py3-none-any.whl']
+    for _ in range(2):
+        assert get(proxy_url + links['foo-1.0.tar.gz']) == (200, FILES['foo-1.0.tar.gz'])
+    assert (proxy.stats['misses'], proxy.stats['hits'], proxy.stats['bytes-fetched']) == (1, 1, 1000)
+    base = links['foo-1.0.tar.gz'].split('/')[2]
+    for fname in ['..%2Fsecret.txt', '%2e%2e%2fsecret.txt', '%2E%2E%2Fsecret.txt', '.hidden', 'missing.whl']:
+        assert get(f'{proxy_url}/files/{base}/{fname}') == (404, None)
+    proxy.stop()
+
+
+def test_stalled_upstream_times_out(tmp_path, monkeypatch):
+    # connections to a socket that listens but never accepts stall after connecting
+    stalled = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    stalled.bind(('127.0.0.1', 0))
+    stalled.listen(16)
+    monkeypatch.setattr(index_proxy, 'UPSTREAM_TIMEOUT', 1)
+    proxy, proxy_url = start_proxy(tmp_path, f'http://127.0.0.1:{stalled.getsockname()[1]}/simple/')
+    assert get(f'{proxy_url}/simple/foo/') == (502, None)
+    proxy.stop()
+    stalled.close()
+
+
+def test_project_names():
+    assert index_proxy.get_project_name('foo-1.0-py3-none-any.whl') == 'foo'
+    assert index_proxy.get_project_name('Foo_Bar-1.0-cp312-cp312-manylinux_2_17_aarch64.whl') == 'foo-bar'
+    assert index_proxy.get_project_name('foo-bar-2.0.tar.gz') == 'foo-bar'
+    assert index_proxy.get_project_name('foo.bar-2.0.zip') == 'foo-bar'
+    assert index_proxy.get_project_name('README.txt') is None
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import hashlib
+import argparse
+import importlib
+from datetime import datetime
+
+process_results = importlib.import_module("process-results")
+
+# Keeps a history page per wheel in a website directory, updated one run at a time. The state
+# of the site is saved next to the pages in site-state.json: for every wheel the current state
+# of each of its tests, the list of changes of those states, and the hash of its page. A page
+# only records the runs in which a result changed, so it is only written again when one of the
+# results of its wheel changes, and the nightly update does not grow with the history depth.
+
+STATE_FNAME = 'site-state.json'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# bump to regenerate every page after changing how they are rendered
+PAGE_VERSION = 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the per-wheel history pages of the website from result files")
+    parser.add_argument('resultfiles', type=str, nargs='+', metavar='results.json', help='path to a result file')
+    parser.add_argument('-o', '--output-dir', type=str, help="directory of the website", required=True)
+    args = parser.parse_args()
+
+    pages = WheelPages(args.output_dir)
+    test_results_list = sorted(process_results.load_test_result_files(args.resultfiles), key=lambda x: x.date)
+    for test_result_file in test_results_list:
+        pages.add_test_result_file(test_result_file)
+    print(f"wrote {pages.write()} wheel pages")
+
+
+def page_path(wheel):
+    return f'wheels/{process_results.canonical_name(wheel)}.html'
+
+
+def get_result_state(result):
+    # the parts of a result a history page shows; fields that change from run to run without
+    # the result changing, like the runtime, stay out so they do not rewrite the page
+    return [bool(result['test-passed']), bool(result.get('timeout', False)), bool(result['build-required']),
+            result.get('installed-version')]
+
+
+class WheelPages():
+    def __init__(self, site_dir):
+        self.site_dir = site_dir
+        self.dirty = set()
+        self.state = {'version': PAGE_VERSION, 'last-run': None, 'wheels': {}}
+        try:
+            with open(f'{site_dir}/{STATE_FNAME}') as f:
+                state = json.load(f)
+            if state.get('version') == PAGE_VERSION:
+                self.state = state
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def last_run(self):
+        last_run = self.state['last-run']
+        return datetime.strptime(last_run, DATE_FORMAT) if last_run is not None else None
+
+    def reset(self):
+        self.state = {'version': PAGE_VERSION, 'last-run': None, 'wheels': {}}
+
+    def add_run(self, date, wheel_results):
+        # wheel_results maps wheel -> test name -> result; runs have to be added oldest first
+        date_text = date.strftime(DATE_FORMAT)
+        for wheel, test_results in wheel_results.items():
+            wheel_state = self.state['wheels'].setdefault(wheel, {'tests': {}, 'changes': [], 'page-hash': None})
+            for test_name, result in sorted(test_results.items()):
+                result_state = get_result_state(result)
+                if wheel_state['tests'].get(test_name, [None])[0] != result_state:
+                    wheel_state['tests'][test_name] = [result_state, date_text]
+                    wheel_state['changes'].append([date_text, test_name, result_state])
+                    self.dirty.add(wheel)
+            if wheel_state['page-hash'] is None:
+                self.dirty.add(wheel)
+        self.state['last-run'] = date_text
+
+    def add_test_result_file(self, test_result_file):
+        self.add_run(test_result_file.date, test_result_file.content)
+
+    def write(self):
+        # writes the pages of the wheels that changed, plus those missing on disk, and the state
+        os.makedirs(f'{self.site_dir}/wheels', exist_ok=True)
+        for wheel, wheel_state in self.state['wheels'].items():
+            if not os.path.exists(f'{self.site_dir}/{page_path(wheel)}'):
+                self.dirty.add(wheel)
+        written = 0
+        for wheel in sorted(self.dirty):
+            html = self.render(wheel)
+            page_hash = hashlib.sha256(html.encode('utf-8')).hexdigest()
+            wheel_state = self.state['wheels'][wheel]
+            path = f'{self.site_dir}/{page_path(wheel)}'
+            if page_hash == wheel_state['page-hash'] and os.path.exists(path):
+                continue
+            with open(path, 'w') as f:
+                f.write(html)
+            wheel_state['page-hash'] = page_hash
+            written += 1
+        self.dirty = set()
+        with open(f'{self.site_dir}/{STATE_FNAME}.tmp', 'w') as f:
+            json.dump(self.state, f, separators=(',', ':'))
+        os.replace(f'{self.site_dir}/{STATE_FNAME}.tmp', f'{self.site_dir}/{STATE_FNAME}')
+        return written
+
+    def render(self, wheel):
+        wheel_state = self.state['wheels'][wheel]
+        pretty = lambda date_text: datetime.strptime(date_text, DATE_FORMAT).strftime("%B %d, %Y")
+        html = [process_results.HTML_HEADER]
+        html.append(f'<h1>{wheel} on aarch64</h1>')
+        html.append('<section class="summary">')
+        html.append('<p><a href="../index.html">back to the latest results</a></p>')
+        html.append('</section>')
+        html.append('<section>')
+        html.append('<h2>current results</h2>')
+        html.append('<table class="python-wheel-report">')
+        html.append('<thead><tr><th>test</th><th>result</th><th>since</th></tr></thead><tbody>')
+        for i, (test_name, (result_state, since)) in enumerate(sorted(wheel_state['tests'].items())):
+            odd_even = 'even' if (i+1) % 2 == 0 else 'odd'
+            html.append(f'<tr class="wheel-line {odd_even}">')
+            html.append(f'<td class="test-column {process_results.get_package_name_class(test_name)}">{test_name}</td>')
+            html.append(f'<td>{self.render_state(result_state)}</td>')
+            html.append(f'<td>{pretty(since)}</td>')
+            html.append('</tr>')
+        html.append('</tbody></table>')
+        html.append('<h2>history of changes</h2>')
+        html.append('<table class="python-wheel-report">')
+        html.append('<thead><tr><th>date</th><th>test</th><th>result</th></tr></thead><tbody>')
+        for i, (date_text, test_name, result_state) in enumerate(reversed(wheel_state['changes'])):
+            odd_even = 'even' if (i+1) % 2 == 0 else 'odd'
+            html.append(f'<tr class="wheel-line {odd_even}">')
+            html.append(f'<td>{pretty(date_text)}</td>')
+            html.append(f'<td class="test-column {process_results.get_package_name_class(test_name)}">{test_name}</td>')
+            html.append(f'<td>{self.render_state(result_state)}</td>')
+            html.append('</tr>')
+        html.append('</tbody></table>')
+        html.append('</section>')
+        html.append(process_results.HTML_FOOTER)
+        return '\n'.join(html)
+
+    def render_state(self, result_state):
+        passed, timeout, build_required, installed_version = result_state
+        html = []
+        if passed:
+            html.append(process_results.make_badge(classes=['passed'], text='passed'))
+        else:
+            html.append(process_results.make_badge(classes=['failed'], text='failed'))
+        if installed_version:
+            html.append(process_results.make_badge(classes=['passed'], text=f'installed version {installed_version}'))
+        if build_required:
+            html.append(process_results.make_badge(classes=['warning'], text='build required'))
+        if timeout:
+            html.append(process_results.make_badge(classes=['failed'], text='timed out'))
+        return ''.join(html)
+
+
+if __name__ == '__main__':
+    main()